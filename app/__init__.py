@@ -0,0 +1,9 @@
+import os
+
+from dotenv import load_dotenv
+
+# Load .env once, before any module reads its settings; child processes inherit the
+# flag along with the variables and skip the file search
+if not os.environ.get("_DOTENV_LOADED"):
+    load_dotenv(override=False)
+    os.environ["_DOTENV_LOADED"] = "1"
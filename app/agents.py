@@ -1,11 +1,26 @@
+import asyncio
+import contextvars
+import logging
+import os
+from functools import lru_cache
+from typing import Optional, get_args
 from langchain.agents import create_agent
+from langchain.chat_models import init_chat_model
+from langchain.agents.middleware import wrap_model_call
 from langchain.agents.structured_output import ToolStrategy
+from langchain_core.messages import SystemMessage
+from langchain_core.rate_limiters import InMemoryRateLimiter
+from langchain_core.utils.json import parse_partial_json
+from langgraph.config import get_stream_writer
+from pydantic import BaseModel, TypeAdapter, ValidationError
 from app.models import (
     LearningPlan, Lecture, Quiz, Assignment, GradingResult,
     ProgressDecision, RepeatMessage, AdvanceMessage, ShortAnswerEvaluation, LearningInput,
+    ShortAnswerEvaluationBatch, Decision, Confidence,
     QuizAnswersParsed, AssignmentSubmissionParsed
 )
 from app.tools import search
+from app.cache import batch_llm_cache, llm_cache, normalize_text, score_bucket
 from app.prompts import (
     LEARNING_PLAN_SYSTEM_PROMPT, 
     LEARNING_PLAN_PROMPT, 
@@ -25,6 +40,7 @@ from app.prompts import (
     ADVANCE_LESSON_PROMPT,
     SHORT_ANSWER_EVALUATION_SYSTEM_PROMPT,
     SHORT_ANSWER_EVALUATION_PROMPT,
+    SHORT_ANSWER_BATCH_EVALUATION_PROMPT,
     EXTRACTION_PROMPT,
     EXTRACTION_SYSTEM_PROMPT,
     QUIZ_ANSWER_PARSER_SYSTEM_PROMPT,
@@ -33,95 +49,360 @@ from app.prompts import (
     ASSIGNMENT_SUBMISSION_PARSER_PROMPT
 )
 
+logger = logging.getLogger(__name__)
+
+LLM_MODEL = os.getenv("LLM_MODEL", "anthropic:claude-haiku-4-5-20251001")
+# Stronger model that re-answers evaluations the default model is unsure about
+ESCALATION_MODEL = os.getenv("ESCALATION_MODEL", "anthropic:claude-sonnet-4-5-20250929")
+
+# Shared across all agents and every student served by this process: a token bucket paces
+# requests under the provider's rate limit, and the client retries 429/overloaded/timeout
+# errors with exponential backoff. The default suits a 1000 requests/minute API tier
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_REQUESTS_PER_SECOND = float(os.getenv("LLM_REQUESTS_PER_SECOND", "15"))
+_rate_limiter = InMemoryRateLimiter(
+    requests_per_second=LLM_REQUESTS_PER_SECOND,
+    check_every_n_seconds=0.05,
+    max_bucket_size=max(LLM_REQUESTS_PER_SECOND, 1)
+)
+
+
+@lru_cache(maxsize=None)
+def get_chat_model(model_name: str = LLM_MODEL, latency_optimized: bool = False):
+    """
+    Return one shared chat model per configuration so agents reuse a single client
+    
+    latency_optimized requests latency-optimized inference for agents the student
+    is waiting on. Only Bedrock exposes this setting; for other providers it is a no-op.
+    """
+    if latency_optimized:
+        if not model_name.startswith("bedrock_converse:"):
+            return get_chat_model(model_name)
+        return init_chat_model(
+            model_name,
+            performance_config={"latency": "optimized"},
+            max_retries=LLM_MAX_RETRIES,
+            rate_limiter=_rate_limiter
+        )
+    return init_chat_model(model_name, max_retries=LLM_MAX_RETRIES, rate_limiter=_rate_limiter)
+
+
+# Bound the number of in-flight model calls across every student served by this process,
+# so parallel lesson steps stay under rate limits. Background prefetches draw on a smaller budget of their own so they never
+# hold a slot a waiting student needs. Only the model request holds a slot, not the
+# tool calls (web searches) between requests.
+MAX_CONCURRENT_LLM_CALLS = int(os.getenv("MAX_CONCURRENT_LLM_CALLS", "32"))
+MAX_CONCURRENT_PREFETCH_CALLS = int(os.getenv("MAX_CONCURRENT_PREFETCH_CALLS", "8"))
+_llm_semaphore = asyncio.Semaphore(MAX_CONCURRENT_LLM_CALLS)
+_prefetch_semaphore = asyncio.Semaphore(MAX_CONCURRENT_PREFETCH_CALLS)
+_llm_budget: contextvars.ContextVar[asyncio.Semaphore] = contextvars.ContextVar(
+    "llm_budget", default=_llm_semaphore
+)
+
+
+def use_prefetch_budget() -> None:
+    """Make model calls in the current context wait on the prefetch budget"""
+    _llm_budget.set(_prefetch_semaphore)
+
+
+@wrap_model_call
+async def limit_concurrency(request, handler):
+    """Hold a slot from the current context's budget for the duration of one model request"""
+    async with _llm_budget.get():
+        return await handler(request)
+
+
+# Chat model types whose APIs take Anthropic's cache_control blocks (the Anthropic API,
+# and Bedrock's InvokeModel client for Claude). Bedrock's Converse API marks cache
+# points with its own blocks, and other providers cache prefixes automatically or not at all
+CACHE_CONTROL_LLM_TYPES = {"anthropic-chat", "amazon_bedrock_chat"}
+# The marked prefix is the tool definitions plus the system prompt (Anthropic orders tools
+# first). That is roughly 2-3k tokens for the search agents and under 1k for the rest, so it
+# is only cached on models whose minimum cacheable prefix is lower (1024 tokens for Sonnet
+# 4.5); Haiku 4.5, the default LLM_MODEL, needs 4096 and ignores the marker
+
+
+@wrap_model_call
+async def cache_system_prompt(request, handler):
+    """Send the static system prompt as a cache-marked block so Anthropic reuses the prefix"""
+    if not request.system_prompt or getattr(request.model, "_llm_type", None) not in CACHE_CONTROL_LLM_TYPES:
+        return await handler(request)
+    system_message = SystemMessage(content=[{
+        "type": "text",
+        "text": request.system_prompt,
+        "cache_control": {"type": "ephemeral"}
+    }])
+    return await handler(request.override(
+        system_prompt=None,
+        messages=[system_message, *request.messages]
+    ))
+
+
+# Tool-free agents pass their schema directly so create_agent picks provider-native
+# structured output when the model supports it, falling back to a forced tool call.
+# Agents with search tools keep ToolStrategy so the schema is just another tool.
 extraction_agent = create_agent(
-    "anthropic:claude-haiku-4-5-20251001",
+    get_chat_model(),
     tools=[],
     system_prompt=EXTRACTION_SYSTEM_PROMPT,
-    response_format=ToolStrategy(LearningInput)
+    response_format=LearningInput,
+    middleware=[limit_concurrency, cache_system_prompt]
 )
 
 curriculum_agent = create_agent(
-    "anthropic:claude-haiku-4-5-20251001",
+    get_chat_model(),
     tools=[search],
     system_prompt=LEARNING_PLAN_SYSTEM_PROMPT,
-    response_format=ToolStrategy(LearningPlan)
+    response_format=ToolStrategy(LearningPlan),
+    middleware=[limit_concurrency, cache_system_prompt]
 )
 
 lecture_agent = create_agent(
-    "anthropic:claude-haiku-4-5-20251001",
+    get_chat_model(latency_optimized=True),
     tools=[search],
     system_prompt=LECTURE_SYSTEM_PROMPT,
-    response_format=ToolStrategy(Lecture)
+    response_format=ToolStrategy(Lecture),
+    middleware=[limit_concurrency, cache_system_prompt]
 )
 
 quiz_agent = create_agent(
-    "anthropic:claude-haiku-4-5-20251001",
+    get_chat_model(latency_optimized=True),
     tools=[],
     system_prompt=QUIZ_SYSTEM_PROMPT,
-    response_format=ToolStrategy(Quiz)
+    response_format=Quiz,
+    middleware=[limit_concurrency, cache_system_prompt]
 )
 
 assignment_agent = create_agent(
-    "anthropic:claude-haiku-4-5-20251001",
+    get_chat_model(),
     tools=[],
     system_prompt=ASSIGNMENT_SYSTEM_PROMPT,
-    response_format=ToolStrategy(Assignment)
+    response_format=Assignment,
+    middleware=[limit_concurrency, cache_system_prompt]
 )
 
 grading_agent = create_agent(
-    "anthropic:claude-haiku-4-5-20251001",
+    get_chat_model(),
     tools=[],
     system_prompt=GRADING_SYSTEM_PROMPT,
-    response_format=ToolStrategy(GradingResult)
+    response_format=GradingResult,
+    middleware=[limit_concurrency, cache_system_prompt]
 )
 
 progress_check_agent = create_agent(
-    "anthropic:claude-haiku-4-5-20251001",
+    get_chat_model(),
     tools=[],
     system_prompt=PROGRESS_CHECK_SYSTEM_PROMPT,
-    response_format=ToolStrategy(ProgressDecision)
+    response_format=ProgressDecision,
+    middleware=[limit_concurrency, cache_system_prompt]
 )
 
 repeat_message_agent = create_agent(
-    "anthropic:claude-haiku-4-5-20251001",
+    get_chat_model(),
     tools=[],
     system_prompt=REPEAT_LESSON_SYSTEM_PROMPT,
-    response_format=ToolStrategy(RepeatMessage)
+    response_format=RepeatMessage,
+    middleware=[limit_concurrency, cache_system_prompt]
 )
 
 advance_message_agent = create_agent(
-    "anthropic:claude-haiku-4-5-20251001",
+    get_chat_model(),
     tools=[],
     system_prompt=ADVANCE_LESSON_SYSTEM_PROMPT,
-    response_format=ToolStrategy(AdvanceMessage)
+    response_format=AdvanceMessage,
+    middleware=[limit_concurrency, cache_system_prompt]
 )
 
 short_answer_evaluator_agent = create_agent(
-    "anthropic:claude-haiku-4-5-20251001",
+    get_chat_model(latency_optimized=True),
     tools=[],
     system_prompt=SHORT_ANSWER_EVALUATION_SYSTEM_PROMPT,
-    response_format=ToolStrategy(ShortAnswerEvaluation)
+    response_format=ShortAnswerEvaluation,
+    middleware=[limit_concurrency, cache_system_prompt]
 )
 
-async def extract_topic_and_background(query: str) -> LearningInput:
+short_answer_batch_evaluator_agent = create_agent(
+    get_chat_model(latency_optimized=True),
+    tools=[],
+    system_prompt=SHORT_ANSWER_EVALUATION_SYSTEM_PROMPT,
+    response_format=ShortAnswerEvaluationBatch,
+    middleware=[limit_concurrency, cache_system_prompt]
+)
 
-    prompt = EXTRACTION_PROMPT.format(query=query)
+# Escalation agents for low-confidence evaluations
+progress_check_escalation_agent = create_agent(
+    get_chat_model(ESCALATION_MODEL),
+    tools=[],
+    system_prompt=PROGRESS_CHECK_SYSTEM_PROMPT,
+    response_format=ProgressDecision,
+    middleware=[limit_concurrency, cache_system_prompt]
+)
+
+short_answer_escalation_agent = create_agent(
+    get_chat_model(ESCALATION_MODEL),
+    tools=[],
+    system_prompt=SHORT_ANSWER_EVALUATION_SYSTEM_PROMPT,
+    response_format=ShortAnswerEvaluation,
+    middleware=[limit_concurrency, cache_system_prompt]
+)
 
-    result = await extraction_agent.ainvoke({
+async def _ainvoke(agent, prompt: str):
+    """Invoke an agent with a single user prompt and return its structured response"""
+    result = await agent.ainvoke({
         "messages": [
             {"role": "user", "content": prompt}
         ]
     })
+    return result['structured_response']
+
+
+async def _ainvoke_with_escalation(agent, escalation_agent, prompt: str):
+    """Invoke an agent, re-asking the escalation model when the response has low confidence"""
+    response = await _ainvoke(agent, prompt)
+    if response.confidence == Confidence.LOW:
+        logger.info("[Escalation] Low confidence response, retrying with %s", ESCALATION_MODEL)
+        response = await _ainvoke(escalation_agent, prompt)
+    return response
+
+
+# Student-supplied text (submissions, answer messages) is the only prompt field without a
+# natural size limit; cap it so a pasted file can't overflow the model's context window.
+# Counted in characters (about 4 per token) since the hosted models' tokenizers aren't local
+MAX_STUDENT_TEXT_CHARS = int(os.getenv("MAX_STUDENT_TEXT_CHARS", "60000"))
+
+
+def _fit(text: str, max_chars: int = MAX_STUDENT_TEXT_CHARS) -> str:
+    """Trim text to max_chars, cutting at the last line break inside the budget and noting the cut"""
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind("\n", 0, max_chars)
+    if cut < max_chars // 2:
+        cut = max_chars
+    return f"{text[:cut]}\n[... {len(text) - cut} more characters truncated]"
+
+
+# A lesson's objectives and concepts are formatted by several agents in turn
+# (lecture, quiz, assignment), so the rendered fragments are cached
+@lru_cache(maxsize=256)
+def _bullets(items: tuple[str, ...]) -> str:
+    """Format items as a markdown bullet list"""
+    return "- " + "\n- ".join(items) if items else ""
+
+
+@lru_cache(maxsize=256)
+def _csv(items: tuple[str, ...]) -> str:
+    """Format items as a comma-separated list"""
+    return ", ".join(items)
+
+
+@lru_cache(maxsize=None)
+def _item_adapter(schema: type[BaseModel], field: str) -> TypeAdapter:
+    """Validator for one item of a schema's list field"""
+    return TypeAdapter(get_args(schema.model_fields[field].annotation)[0])
+
+
+async def _astream_items(agent, prompt: str, schema: type[BaseModel], field: str, event: str):
+    """
+    Invoke an agent, writing each finished item of a list field to the graph's custom stream
+    
+    The structured response arrives as streamed tool-call arguments; they are parsed
+    incrementally and an item is emitted as soon as the next one starts and it
+    validates against the item schema, in the same JSON shape as the final items.
+    If the model retries the structured output call, items are emitted again from
+    index 0, so clients should key them by index. Outside a LangGraph run there is
+    no stream to write to, so this is a plain invoke.
+    """
+    try:
+        writer = get_stream_writer()
+    except RuntimeError:
+        return await _ainvoke(agent, prompt)
+    
+    schema_name = schema.__name__
+    adapter = _item_adapter(schema, field)
+    args_buffers: dict[int, str] = {}
+    active_calls: dict[int, bool] = {}
+    emitted = 0
+    final_state = None
+    
+    async for mode, chunk in agent.astream(
+        {"messages": [{"role": "user", "content": prompt}]},
+        stream_mode=["messages", "values"]
+    ):
+        if mode == "values":
+            final_state = chunk
+            continue
+        
+        message, _ = chunk
+        for call_chunk in getattr(message, "tool_call_chunks", None) or []:
+            index = call_chunk.get("index") or 0
+            if call_chunk.get("name"):
+                active_calls[index] = call_chunk["name"] == schema_name
+                args_buffers[index] = ""
+                if active_calls[index]:
+                    # A new attempt at the response replaces whatever an earlier one streamed
+                    emitted = 0
+            if not active_calls.get(index) or not call_chunk.get("args"):
+                continue
+            
+            args_buffers[index] += call_chunk["args"]
+            # List items are objects, so a new one can only have started if this
+            # chunk opens a brace; skip re-parsing the whole buffer otherwise
+            if "{" not in call_chunk["args"]:
+                continue
+            partial = parse_partial_json(args_buffers[index]) or {}
+            items = partial.get(field) or []
+            # An item is complete once the model has moved on to the next one
+            while emitted < len(items) - 1:
+                try:
+                    item = adapter.validate_python(items[emitted])
+                except ValidationError:
+                    # Left for the final response, which is validated (and retried) as a whole
+                    break
+                writer({"type": event, "index": emitted, "item": adapter.dump_python(item, mode="json")})
+                emitted += 1
+    
+    structured_response = final_state['structured_response']
+    for index, item in enumerate(getattr(structured_response, field)[emitted:], start=emitted):
+        writer({"type": event, "index": index, "item": item.model_dump(mode="json")})
+    return structured_response
+
+
+# Paraphrased requests ("teach me SQL, I'm new to databases") reuse an earlier
+# extraction; the bar is high because a changed skill level must still miss
+EXTRACTION_SEMANTIC_THRESHOLD = 0.95
+
+
+@llm_cache(
+    key=lambda query: normalize_text(query),
+    semantic=lambda query: (None, normalize_text(query)),
+    threshold=EXTRACTION_SEMANTIC_THRESHOLD
+)
+async def extract_topic_and_background(query: str) -> LearningInput:
+
+    prompt = EXTRACTION_PROMPT.format(query=query)
+
+    return await _ainvoke(extraction_agent, prompt)
+
+# Plans are reused for 30 days; similar backgrounds on the same topic share a plan
+LEARNING_PLAN_CACHE_TTL = 30 * 24 * 60 * 60
 
-    return result["structured_response"]
 
+@llm_cache(
+    key=lambda topic, background: (normalize_text(topic), normalize_text(background)),
+    semantic=lambda topic, background: (normalize_text(topic), normalize_text(background)),
+    ttl=LEARNING_PLAN_CACHE_TTL,
+    threshold=0.9
+)
 async def create_learning_plan(topic: str, background: str) -> LearningPlan:
     """
     Create a comprehensive learning plan for a given topic
     
     Generates a structured curriculum with 5-8 progressive lessons tailored to the
     student's background. Uses web search to find relevant resources and ensure
-    up-to-date, accurate content.
+    up-to-date, accurate content. When run inside the graph, each lesson is
+    written to the custom stream ("lesson" events) as soon as it is generated.
+    Plans are cached per topic, and a similar background on the same topic
+    reuses an earlier plan.
     
     Args:
         topic: The subject or topic to create a learning plan for (e.g., "Python Programming",
@@ -149,13 +430,17 @@ async def create_learning_plan(topic: str, background: str) -> LearningPlan:
         Generated 6 lessons for Python Programming
     """
     prompt = LEARNING_PLAN_PROMPT.format(topic=topic, background=background)
-    result = await curriculum_agent.ainvoke({
-        "messages": [
-            {"role": "user", "content": prompt}
-        ]
-    })
-    return result['structured_response']
+    return await _astream_items(curriculum_agent, prompt, LearningPlan, "lessons", "lesson")
 
+@llm_cache(
+    key=lambda lesson_title, objectives, key_concepts, current_knowledge="", weak_points=None: (
+        lesson_title,
+        tuple(objectives),
+        tuple(key_concepts),
+        current_knowledge,
+        tuple(sorted(normalize_text(wp) for wp in weak_points or ()))
+    )
+)
 async def create_lecture(
     lesson_title: str,
     objectives: list[str],
@@ -166,6 +451,11 @@ async def create_lecture(
     """
     Create a lecture for a specific lesson
     
+    When run inside the graph, each segment is written to the custom stream
+    ("lecture_segment" events) as soon as it is generated.
+    Lectures are cached per lesson and weak points, so a repeat with the same
+    focus areas reuses the earlier lecture instead of generating a new one.
+    
     Args:
         lesson_title: The title of the lesson
         objectives: List of learning objectives for the lesson
@@ -182,26 +472,28 @@ async def create_lecture(
     # Format the prompt with all required variables
     prompt = LECTURE_PROMPT.format(
         lesson_title=lesson_title,
-        objectives="\n".join(f"- {obj}" for obj in objectives),
-        key_concepts=", ".join(key_concepts),
+        objectives=_bullets(tuple(objectives)),
+        key_concepts=_csv(tuple(key_concepts)),
         current_knowledge=current_knowledge or "No prior knowledge assumed",
-        weak_points=", ".join(weak_points) if weak_points else "None identified"
+        weak_points=", ".join(sorted(weak_points)) if weak_points else "None identified"
     )
     
-    # Invoke the lecture agent
-    result = await lecture_agent.ainvoke({
-        "messages": [
-            {"role": "user", "content": prompt}
-        ]
-    })
-    
-    return result['structured_response']
+    # Invoke the lecture agent, streaming segments as they are generated
+    return await _astream_items(lecture_agent, prompt, Lecture, "segments", "lecture_segment")
 
+@llm_cache(
+    key=lambda lesson_title, objectives, key_concepts, lecture_summary, attempt_count=0, weak_points=None: (
+        lesson_title, tuple(objectives), tuple(key_concepts), lecture_summary,
+        attempt_count, tuple(sorted(weak_points or ()))
+    )
+)
 async def create_quiz(
     lesson_title: str,
     objectives: list[str],
     key_concepts: list[str],
-    lecture_summary: str
+    lecture_summary: str,
+    attempt_count: int = 0,
+    weak_points: Optional[list[str]] = None
 ) -> Quiz:
     """
     Create a quiz to assess student understanding of a lecture
@@ -209,6 +501,8 @@ async def create_quiz(
     Generates exactly 5 questions of mixed types (multiple choice, true/false, short answer)
     that test comprehension and application, not just memorization. Questions are aligned
     with learning objectives and assess understanding at different cognitive levels.
+    When run inside the graph, each question is written to the custom stream
+    ("quiz_question" events) as soon as it is generated.
     
     Args:
         lesson_title: The title of the lesson being assessed
@@ -216,6 +510,9 @@ async def create_quiz(
         key_concepts: List of key concepts that should be covered in the questions
         lecture_summary: A summary of the lecture content to ensure questions are
                         answerable based on what was taught
+        attempt_count: Earlier attempts at this lesson; a repeat gets a new quiz
+                       rather than the cached one
+        weak_points: Optional; concepts the student struggled with last attempt
     
     Returns:
         Quiz: A structured quiz containing:
@@ -239,39 +536,44 @@ async def create_quiz(
     # Format the prompt with all required variables
     prompt = QUIZ_PROMPT.format(
         lesson_title=lesson_title,
-        objectives="\n".join(f"- {obj}" for obj in objectives),
-        key_concepts=", ".join(key_concepts),
-        lecture_summary=lecture_summary
+        objectives=_bullets(tuple(objectives)),
+        key_concepts=_csv(tuple(key_concepts)),
+        lecture_summary=lecture_summary,
+        attempt_count=attempt_count,
+        weak_points=", ".join(sorted(weak_points)) if weak_points else "None identified"
     )
     
-    # Invoke the quiz agent
-    result = await quiz_agent.ainvoke({
-        "messages": [
-            {"role": "user", "content": prompt}
-        ]
-    })
-    
-    return result['structured_response']
+    # Invoke the quiz agent, streaming questions as they are generated
+    return await _astream_items(quiz_agent, prompt, Quiz, "questions", "quiz_question")
 
 
+@llm_cache(
+    key=lambda lesson_title, objectives, key_concepts, quiz_performance, attempt_count=0: (
+        lesson_title, tuple(objectives), tuple(key_concepts), quiz_performance, attempt_count
+    )
+)
 async def create_assignment(
     lesson_title: str,
     objectives: list[str],
     key_concepts: list[str],
-    quiz_performance: str
+    quiz_performance: str,
+    attempt_count: int = 0
 ) -> Assignment:
     """
     Creates a hands-on assignment for a lesson based on objectives and concepts.
     
     This function generates a practical assignment designed to reinforce learning
     objectives through hands-on exercises. It takes into account the student's
-    quiz performance to ensure appropriate difficulty and focus areas.
+    quiz performance to ensure appropriate difficulty and focus areas. When run
+    inside the graph, each step is written to the custom stream ("assignment_step"
+    events) as soon as it is generated.
     
     Args:
         lesson_title: The title/topic of the lesson
         objectives: List of learning objectives for the lesson
         key_concepts: List of key concepts that should be practiced
         quiz_performance: Summary of how the student performed on the quiz
+        attempt_count: Earlier attempts at this lesson; a repeat gets a new assignment
         
     Returns:
         Assignment: A structured assignment with title, overview, steps, and criteria
@@ -288,16 +590,39 @@ async def create_assignment(
     """
     prompt = ASSIGNMENT_PROMPT.format(
         lesson_title=lesson_title,
-        objectives="\n".join([f"- {obj}" for obj in objectives]),
-        key_concepts=", ".join(key_concepts),
+        objectives=_bullets(tuple(objectives)),
+        key_concepts=_csv(tuple(key_concepts)),
         quiz_results=quiz_performance,
-        weak_points="None identified"  # Will be populated from actual quiz results in production
+        weak_points="None identified",  # Will be populated from actual quiz results in production
+        attempt_count=attempt_count
     )
     
-    result = await assignment_agent.ainvoke({"messages": [{"role": "user", "content": prompt}]})
-    return result['structured_response']
+    return await _astream_items(assignment_agent, prompt, Assignment, "steps", "assignment_step")
+
+
+def format_grading_prompt(
+    assignment_title: str,
+    assignment_steps: list[str],
+    criteria: list[str],
+    student_submission: str
+) -> str:
+    """Build the grading prompt shared by live and batch grading"""
+    # Format assignment instructions and steps
+    assignment_instructions = f"Assignment: {assignment_title}\n\nSteps:\n" + "\n".join([f"{i+1}. {step}" for i, step in enumerate(assignment_steps)])
+    
+    return GRADING_PROMPT.format(
+        assignment_instructions=assignment_instructions,
+        submission=_fit(student_submission),
+        success_criteria=_bullets(tuple(criteria)),
+        objectives="Evaluate against assignment requirements"  # This should be passed from the lesson
+    )
 
 
+@llm_cache(
+    key=lambda assignment_title, assignment_steps, criteria, student_submission: (
+        assignment_title, tuple(assignment_steps), tuple(criteria), student_submission.strip()
+    )
+)
 async def grade_assignment(
     assignment_title: str,
     assignment_steps: list[str],
@@ -330,18 +655,41 @@ async def grade_assignment(
         >>> print(result.score)
         85
     """
-    # Format assignment instructions and steps
-    assignment_instructions = f"Assignment: {assignment_title}\n\nSteps:\n" + "\n".join([f"{i+1}. {step}" for i, step in enumerate(assignment_steps)])
-    
-    prompt = GRADING_PROMPT.format(
-        assignment_instructions=assignment_instructions,
-        submission=student_submission,
-        success_criteria="\n".join([f"- {c}" for c in criteria]),
-        objectives="Evaluate against assignment requirements"  # This should be passed from the lesson
+    prompt = format_grading_prompt(assignment_title, assignment_steps, criteria, student_submission)
+    return await _ainvoke(grading_agent, prompt)
+
+
+@llm_cache(
+    key=lambda lesson_title, quiz_score, assignment_score, weak_points, attempt_count, next_lesson: (
+        normalize_text(lesson_title),
+        score_bucket(quiz_score),
+        score_bucket(assignment_score),
+        tuple(sorted(normalize_text(wp) for wp in weak_points)),
+        attempt_count,
+        normalize_text(next_lesson)
+    )
+)
+async def _decide_progress(
+    lesson_title: str,
+    quiz_score: int,
+    assignment_score: int,
+    weak_points: list[str],
+    attempt_count: int,
+    next_lesson: str
+) -> ProgressDecision:
+    """Run the progress check agent; cached per lesson, score decile, weak points and attempt"""
+    prompt = PROGRESS_CHECK_PROMPT.format(
+        current_lesson=lesson_title,
+        total_lessons="unknown",  # Not available at this level
+        quiz_score=quiz_score,
+        assignment_score=assignment_score,
+        weak_points=", ".join(sorted(weak_points)) if weak_points else "None identified",
+        attempt_count=attempt_count,
+        topic="current curriculum",  # Not available at this level
+        next_lesson=next_lesson
     )
     
-    result = await grading_agent.ainvoke({"messages": [{"role": "user", "content": prompt}]})
-    return result['structured_response']
+    return await _ainvoke_with_escalation(progress_check_agent, progress_check_escalation_agent, prompt)
 
 
 async def check_progress(
@@ -349,14 +697,16 @@ async def check_progress(
     quiz_score: int,
     assignment_score: int,
     weak_points: list[str],
-    attempt_count: int
+    attempt_count: int,
+    next_lesson: str = "N/A"
 ) -> ProgressDecision:
     """
     Determines whether a student should repeat a lesson or advance to the next one.
     
     This function analyzes the student's performance on both quiz and assignment,
     considers identified weak points, and tracks the number of attempts to make
-    an informed decision about progression.
+    an informed decision about progression. The same call also writes the
+    student-facing repeat or advance message for the decision it makes.
     
     Args:
         lesson_title: The title of the current lesson
@@ -364,9 +714,11 @@ async def check_progress(
         assignment_score: The student's assignment score (0-100)
         weak_points: List of concepts the student struggled with
         attempt_count: Number of times the student has attempted this lesson
+        next_lesson: The title of the next lesson, previewed in the advance message
         
     Returns:
-        ProgressDecision: Decision to repeat or advance with reasoning
+        ProgressDecision: Decision to repeat or advance with reasoning and the
+            matching repeat_message or advance_message
         
     Example:
         >>> decision = await check_progress(
@@ -379,18 +731,16 @@ async def check_progress(
         >>> print(decision.decision.value)
         "advance"
     """
-    prompt = PROGRESS_CHECK_PROMPT.format(
-        current_lesson=lesson_title,
-        total_lessons="unknown",  # Not available at this level
+    decision = await _decide_progress(
+        lesson_title=lesson_title,
         quiz_score=quiz_score,
         assignment_score=assignment_score,
-        weak_points=", ".join(weak_points) if weak_points else "None identified",
+        weak_points=weak_points,
         attempt_count=attempt_count,
-        topic="current curriculum"  # Not available at this level
+        next_lesson=next_lesson
     )
-    
-    result = await progress_check_agent.ainvoke({"messages": [{"role": "user", "content": prompt}]})
-    return result['structured_response']
+    # Cached decisions are shared across a score bucket, so report this attempt's exact scores
+    return decision.model_copy(update={"quiz_score": quiz_score, "assignment_score": assignment_score})
 
 
 async def create_repeat_message(
@@ -426,12 +776,11 @@ async def create_repeat_message(
         quiz_score="N/A",  # Not available at this level
         assignment_score="N/A",  # Not available at this level
         attempt_count=attempt_count,
-        weak_points=", ".join(weak_points) if weak_points else "general concepts",
+        weak_points=", ".join(sorted(weak_points)) if weak_points else "general concepts",
         objectives=f"Master the concepts in {lesson_title}"
     )
     
-    result = await repeat_message_agent.ainvoke({"messages": [{"role": "user", "content": prompt}]})
-    return result['structured_response']
+    return await _ainvoke(repeat_message_agent, prompt)
 
 
 async def create_advance_message(
@@ -472,62 +821,231 @@ async def create_advance_message(
         total_lessons="N/A"  # Not available at this level
     )
     
-    result = await advance_message_agent.ainvoke({"messages": [{"role": "user", "content": prompt}]})
-    return result['structured_response']
+    return await _ainvoke(advance_message_agent, prompt)
 
 
-async def evaluate_short_answer(question: str, key_points: list[str], student_answer: str) -> bool:
+async def evaluate_progress(
+    lesson_title: str,
+    quiz_score: int,
+    assignment_score: int,
+    weak_points: list[str],
+    attempt_count: int,
+    next_lesson: str,
+    key_takeaways: list[str]
+) -> tuple[ProgressDecision, Optional[RepeatMessage], Optional[AdvanceMessage]]:
     """
-    Evaluate a short answer question using an LLM
+    Decide whether to advance or repeat, along with the matching student message.
     
-    Uses an AI agent to determine if a student's short answer demonstrates sufficient
-    understanding of the concept. More sophisticated than keyword matching.
+    The progress check writes the repeat or advance message in the same call as the
+    decision. If the model leaves the message for its decision empty, the dedicated
+    message agent is used as a fallback.
     
     Args:
-        question: The question that was asked
-        key_points: List of key concepts or points that should be addressed
-        student_answer: The student's written response
+        lesson_title: The title of the current lesson
+        quiz_score: The student's quiz score (0-100)
+        assignment_score: The student's assignment score (0-100)
+        weak_points: List of concepts the student struggled with
+        attempt_count: Number of times the student has attempted this lesson
+        next_lesson: The title of the lesson that follows if the student advances
+        key_takeaways: Concepts mastered in the lesson, used for the advance message
         
     Returns:
-        bool: True if answer demonstrates sufficient understanding, False otherwise
+        tuple: (ProgressDecision, RepeatMessage or None, AdvanceMessage or None),
+            with only the message for the decision set
         
     Example:
-        >>> is_correct = await evaluate_short_answer(
-        ...     "What is a variable in programming?",
-        ...     ["storage location", "named reference", "holds data"],
-        ...     "A variable is like a box that stores information"
+        >>> decision, repeat_msg, advance_msg = await evaluate_progress(
+        ...     "Python Variables", 85, 90, [], 0,
+        ...     "Python Data Types", ["Variable assignment"]
         ... )
-        >>> print(is_correct)
-        True
+        >>> print(decision.decision.value, repeat_msg is None)
+        "advance" True
     """
-    key_points_str = ", ".join(key_points)
-    prompt = SHORT_ANSWER_EVALUATION_PROMPT.format(
-        question=question,
-        key_points=key_points_str,
-        student_answer=student_answer
+    decision = await check_progress(
+        lesson_title=lesson_title,
+        quiz_score=quiz_score,
+        assignment_score=assignment_score,
+        weak_points=weak_points,
+        attempt_count=attempt_count,
+        next_lesson=next_lesson
     )
     
-    result = await short_answer_evaluator_agent.ainvoke({
-        "messages": [{"role": "user", "content": prompt}]
-    })
+    if decision.decision == Decision.ADVANCE:
+        advance_msg = decision.advance_message or await create_advance_message(
+            completed_lesson=lesson_title,
+            next_lesson=next_lesson,
+            key_takeaways=key_takeaways
+        )
+        return decision, None, advance_msg
+    
+    repeat_msg = decision.repeat_message or await create_repeat_message(
+        lesson_title=lesson_title,
+        weak_points=weak_points,
+        attempt_count=attempt_count + 1
+    )
+    return decision, repeat_msg, None
+
+
+# Short answers from quiz submissions arriving within this window share one evaluator
+# call (0 disables coalescing); batches are capped so the prompt stays manageable
+SHORT_ANSWER_COALESCE_SECONDS = float(os.getenv("SHORT_ANSWER_COALESCE_MS", "20")) / 1000
+SHORT_ANSWER_BATCH_MAX_ITEMS = int(os.getenv("SHORT_ANSWER_BATCH_MAX_ITEMS", "10"))
+
+_pending_short_answers: list[tuple[list[tuple[str, list[str], str]], asyncio.Future]] = []
+_short_answer_flush: Optional[asyncio.Task] = None
+
+
+# Only exact repeats share a verdict: embedding similarity can't tell "X increases Y"
+# from "X decreases Y", so a paraphrase lookup could pass on a wrong answer
+@batch_llm_cache(
+    key=lambda question, key_points, student_answer: (
+        normalize_text(question),
+        tuple(key_points),
+        normalize_text(student_answer)
+    )
+)
+async def evaluate_short_answers_batch(
+    items: list[tuple[str, list[str], str]]
+) -> list[ShortAnswerEvaluation]:
+    """
+    Evaluate several short answer questions in a single LLM call
     
-    evaluation = result['structured_response']
-    print(f"[Short Answer Eval] Question: '{question[:50]}...'")
-    print(f"[Short Answer Eval] Student: '{student_answer[:50]}...'")
-    print(f"[Short Answer Eval] Result: {evaluation.is_correct} - {evaluation.reasoning}")
+    Verdicts are cached per answer, matched after lowercasing and collapsing
+    whitespace; only the answers without a cached verdict reach the evaluator.
+    Those are sent together so a quiz with multiple short answers costs one round-trip instead
+    of one per question. Submissions that arrive within SHORT_ANSWER_COALESCE_MS of each
+    other (e.g. from concurrent students) are folded into the same call, up to
+    SHORT_ANSWER_BATCH_MAX_ITEMS answers. If the model returns the wrong number
+    of evaluations, each answer is re-evaluated on its own. Low-confidence
+    verdicts are re-checked by the escalation model.
     
-    return evaluation.is_correct
+    Args:
+        items: List of (question, key_points, student_answer) tuples
+        
+    Returns:
+        list[ShortAnswerEvaluation]: One evaluation per item, in the same order
+        
+    Example:
+        >>> evaluations = await evaluate_short_answers_batch([
+        ...     ("What is a variable?", ["storage location", "holds data"], "A box that stores data"),
+        ...     ("Why use functions?", ["reuse", "organization"], "No idea")
+        ... ])
+        >>> print([e.is_correct for e in evaluations])
+        [True, False]
+    """
+    if not items:
+        return []
+    if SHORT_ANSWER_COALESCE_SECONDS <= 0:
+        return await _evaluate_short_answers(items)
+    
+    global _short_answer_flush
+    future = asyncio.get_running_loop().create_future()
+    _pending_short_answers.append((items, future))
+    if _short_answer_flush is None or _short_answer_flush.done():
+        # A fresh context keeps the shared call out of the first caller's run tree
+        _short_answer_flush = asyncio.get_running_loop().create_task(
+            _flush_short_answers(), context=contextvars.Context()
+        )
+    return await future
+
+
+async def _flush_short_answers() -> None:
+    """Evaluate every pending submission once the window closes, in batches of whole submissions"""
+    await asyncio.sleep(SHORT_ANSWER_COALESCE_SECONDS)
+    pending = _pending_short_answers[:]
+    _pending_short_answers.clear()
+    
+    batches, batch, batch_size = [], [], 0
+    for items, future in pending:
+        if batch and batch_size + len(items) > SHORT_ANSWER_BATCH_MAX_ITEMS:
+            batches.append(batch)
+            batch, batch_size = [], 0
+        batch.append((items, future))
+        batch_size += len(items)
+    if batch:
+        batches.append(batch)
+    await asyncio.gather(*(_evaluate_coalesced(batch) for batch in batches))
+
+
+async def _evaluate_coalesced(batch: list[tuple[list, asyncio.Future]]) -> None:
+    """Evaluate several submissions in one call and hand each caller back its own slice"""
+    try:
+        evaluations = await _evaluate_short_answers([item for items, _ in batch for item in items])
+    except Exception as e:
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+        return
+    
+    start = 0
+    for items, future in batch:
+        if not future.done():
+            future.set_result(evaluations[start:start + len(items)])
+        start += len(items)
+
+
+async def _evaluate_short_answers(
+    items: list[tuple[str, list[str], str]]
+) -> list[ShortAnswerEvaluation]:
+    """Run the batch evaluator over items, falling back to single evaluations and escalating unsure ones"""
+    items_str = "\n\n".join(
+        f"### Answer {i+1}\n"
+        f"Question: {question}\n"
+        f"Expected Key Points: {', '.join(key_points)}\n"
+        f"Student's Answer: {student_answer}"
+        for i, (question, key_points, student_answer) in enumerate(items)
+    )
+    prompt = SHORT_ANSWER_BATCH_EVALUATION_PROMPT.format(items=items_str, count=len(items))
+    
+    batch = await _ainvoke(short_answer_batch_evaluator_agent, prompt)
+    evaluations = list(batch.evaluations)
+    
+    item_prompts = [
+        SHORT_ANSWER_EVALUATION_PROMPT.format(
+            question=question,
+            key_points=", ".join(key_points),
+            student_answer=student_answer
+        )
+        for question, key_points, student_answer in items
+    ]
+    
+    if len(evaluations) != len(items):
+        logger.warning("[Short Answer Eval] Expected %d evaluations, got %d; evaluating individually", len(items), len(evaluations))
+        evaluations = list(await asyncio.gather(*[
+            _ainvoke_with_escalation(short_answer_evaluator_agent, short_answer_escalation_agent, item_prompt)
+            for item_prompt in item_prompts
+        ]))
+    else:
+        # Re-evaluate only the answers the batch was unsure about with the escalation model
+        unsure = [i for i, evaluation in enumerate(evaluations) if evaluation.confidence == Confidence.LOW]
+        if unsure:
+            logger.info("[Escalation] %d low confidence evaluations, retrying with %s", len(unsure), ESCALATION_MODEL)
+            escalated = await asyncio.gather(*[
+                _ainvoke(short_answer_escalation_agent, item_prompts[i]) for i in unsure
+            ])
+            for i, evaluation in zip(unsure, escalated):
+                evaluations[i] = evaluation
+    
+    if logger.isEnabledFor(logging.DEBUG):
+        for (question, _, student_answer), evaluation in zip(items, evaluations):
+            logger.debug("[Short Answer Eval] Question: '%.50s...'", question)
+            logger.debug("[Short Answer Eval] Student: '%.50s...'", student_answer)
+            logger.debug("[Short Answer Eval] Result: %s - %s", evaluation.is_correct, evaluation.reasoning)
+    
+    return evaluations
 
 
 # Quiz Answer Parser Agent
 quiz_answer_parser_agent = create_agent(
-    "anthropic:claude-haiku-4-5-20251001",
+    get_chat_model(latency_optimized=True),
     tools=[],
     system_prompt=QUIZ_ANSWER_PARSER_SYSTEM_PROMPT,
-    response_format=ToolStrategy(QuizAnswersParsed)
+    response_format=QuizAnswersParsed,
+    middleware=[limit_concurrency, cache_system_prompt]
 )
 
 
+@llm_cache(key=lambda message, quiz_questions_str: (normalize_text(message), quiz_questions_str))
 async def parse_quiz_answers(message: str, quiz_questions_str: str) -> dict[str, str]:
     """Parse quiz answers from a natural language message.
     
@@ -547,15 +1065,11 @@ async def parse_quiz_answers(message: str, quiz_questions_str: str) -> dict[str,
         {'q0': 'A', 'q1': 'B', 'q2': 'True', 'q3': 'C', 'q4': 'False'}
     """
     prompt = QUIZ_ANSWER_PARSER_PROMPT.format(
-        message=message,
+        message=_fit(message),
         quiz_questions=quiz_questions_str
     )
     
-    result = await quiz_answer_parser_agent.ainvoke({
-        "messages": [{"role": "user", "content": prompt}]
-    })
-    
-    parsed = result['structured_response']
+    parsed = await _ainvoke(quiz_answer_parser_agent, prompt)
     return {
         "q0": parsed.q0,
         "q1": parsed.q1,
@@ -567,13 +1081,15 @@ async def parse_quiz_answers(message: str, quiz_questions_str: str) -> dict[str,
 
 # Assignment Submission Parser Agent
 assignment_submission_parser_agent = create_agent(
-    "anthropic:claude-haiku-4-5-20251001",
+    get_chat_model(),
     tools=[],
     system_prompt=ASSIGNMENT_SUBMISSION_PARSER_SYSTEM_PROMPT,
-    response_format=ToolStrategy(AssignmentSubmissionParsed)
+    response_format=AssignmentSubmissionParsed,
+    middleware=[limit_concurrency, cache_system_prompt]
 )
 
 
+@llm_cache(key=lambda message, assignment_description: (message.strip(), assignment_description))
 async def parse_assignment_submission(message: str, assignment_description: str) -> str:
     """Parse assignment submission from a natural language message.
     
@@ -593,14 +1109,10 @@ async def parse_assignment_submission(message: str, assignment_description: str)
         print('Hello')
     """
     prompt = ASSIGNMENT_SUBMISSION_PARSER_PROMPT.format(
-        message=message,
+        message=_fit(message),
         assignment_description=assignment_description
     )
     
-    result = await assignment_submission_parser_agent.ainvoke({
-        "messages": [{"role": "user", "content": prompt}]
-    })
-    
-    parsed = result['structured_response']
+    parsed = await _ainvoke(assignment_submission_parser_agent, prompt)
     return parsed.submission_text
 
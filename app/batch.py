@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import os
+from typing import Optional, TypeVar
+
+from anthropic import AsyncAnthropic
+from langchain_anthropic.chat_models import convert_to_anthropic_tool
+from pydantic import BaseModel, ValidationError
+
+from app.agents import LLM_MODEL, format_grading_prompt
+from app.models import GradingResult, LearningPlan
+from app.prompts import GRADING_SYSTEM_PROMPT, LEARNING_PLAN_SYSTEM_PROMPT, LEARNING_PLAN_PROMPT
+
+logger = logging.getLogger(__name__)
+
+# Batch settings
+BATCH_POLL_INTERVAL_SECONDS = float(os.getenv("BATCH_POLL_INTERVAL_SECONDS", "30"))
+BATCH_MAX_TOKENS = int(os.getenv("BATCH_MAX_TOKENS", "8192"))
+
+SchemaT = TypeVar("SchemaT", bound=BaseModel)
+
+
+def _batch_model() -> str:
+    """Resolve LLM_MODEL to an Anthropic model id; the Batches API is Anthropic-only"""
+    provider, _, model = LLM_MODEL.rpartition(":")
+    if provider not in ("", "anthropic"):
+        raise ValueError(f"Message batches require an Anthropic model, got {LLM_MODEL}")
+    return model
+
+
+def _batch_request(custom_id: str, system_prompt: str, prompt: str, schema: type[BaseModel]) -> dict:
+    """Build one batch entry that forces the response into the schema's tool"""
+    tool = convert_to_anthropic_tool(schema)
+    return {
+        "custom_id": custom_id,
+        "params": {
+            "model": _batch_model(),
+            "max_tokens": BATCH_MAX_TOKENS,
+            "system": [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}],
+            "messages": [{"role": "user", "content": prompt}],
+            "tools": [tool],
+            "tool_choice": {"type": "tool", "name": tool["name"]}
+        }
+    }
+
+
+async def _run_batch(requests: list[dict], schema: type[SchemaT]) -> list[Optional[SchemaT]]:
+    """Submit a message batch, wait for it to end, and parse each result in request order"""
+    client = AsyncAnthropic()
+    batch = await client.messages.batches.create(requests=requests)
+    logger.info("[Batch] Submitted %s with %d requests", batch.id, len(requests))
+
+    while batch.processing_status != "ended":
+        await asyncio.sleep(BATCH_POLL_INTERVAL_SECONDS)
+        batch = await client.messages.batches.retrieve(batch.id)
+
+    counts = batch.request_counts
+    logger.info("[Batch] %s ended: %d succeeded, %d errored, %d expired",
+                batch.id, counts.succeeded, counts.errored, counts.expired)
+
+    parsed: dict[str, SchemaT] = {}
+    async for entry in await client.messages.batches.results(batch.id):
+        if entry.result.type != "succeeded":
+            logger.warning("[Batch] Request %s did not succeed: %s", entry.custom_id, entry.result.type)
+            continue
+        tool_input = next(
+            (block.input for block in entry.result.message.content if block.type == "tool_use"),
+            None
+        )
+        try:
+            parsed[entry.custom_id] = schema.model_validate(tool_input)
+        except ValidationError as e:
+            logger.warning("[Batch] Request %s returned an invalid %s: %s", entry.custom_id, schema.__name__, e)
+
+    return [parsed.get(request["custom_id"]) for request in requests]
+
+
+async def grade_assignments_batch(
+    items: list[tuple[str, list[str], list[str], str]]
+) -> list[Optional[GradingResult]]:
+    """
+    Grade many assignment submissions through the Anthropic Message Batches API
+
+    Meant for offline work such as regrading a cohort, where nobody is waiting
+    on the result: batches cost about half as much as live calls but can take
+    minutes (up to 24 hours) to finish. Use grade_assignment for interactive grading.
+
+    Args:
+        items: List of (assignment_title, assignment_steps, criteria, student_submission)
+               tuples, the same arguments grade_assignment takes
+
+    Returns:
+        list: One GradingResult per item in the same order, or None where the
+            request errored, expired, or returned an invalid result
+
+    Example:
+        >>> results = await grade_assignments_batch([
+        ...     ("Python Functions Practice", ["Write a function"], ["Correct syntax"], "def f(): pass"),
+        ...     ("Python Functions Practice", ["Write a function"], ["Correct syntax"], "print(1)")
+        ... ])
+        >>> print([r.score for r in results if r])
+        [80.0, 40.0]
+    """
+    requests = [
+        _batch_request(
+            f"grade-{i}",
+            GRADING_SYSTEM_PROMPT,
+            format_grading_prompt(assignment_title, assignment_steps, criteria, student_submission),
+            GradingResult
+        )
+        for i, (assignment_title, assignment_steps, criteria, student_submission) in enumerate(items)
+    ]
+    return await _run_batch(requests, GradingResult) if requests else []
+
+
+async def create_learning_plans_batch(
+    items: list[tuple[str, str]]
+) -> list[Optional[LearningPlan]]:
+    """
+    Generate learning plans for many students through the Message Batches API
+
+    Batch requests are single-turn, so unlike create_learning_plan the curriculum
+    is written without web search. Use this for pre-generating plans for a cohort,
+    not for a student who is waiting.
+
+    Args:
+        items: List of (topic, background) tuples
+
+    Returns:
+        list: One LearningPlan per item in the same order, or None where the
+            request errored, expired, or returned an invalid plan
+
+    Example:
+        >>> plans = await create_learning_plans_batch([
+        ...     ("Python Programming", "Complete beginner"),
+        ...     ("Machine Learning", "Knows Python basics")
+        ... ])
+        >>> print([len(p.lessons) for p in plans if p])
+        [6, 7]
+    """
+    requests = [
+        _batch_request(
+            f"plan-{i}",
+            LEARNING_PLAN_SYSTEM_PROMPT,
+            LEARNING_PLAN_PROMPT.format(topic=topic, background=background),
+            LearningPlan
+        )
+        for i, (topic, background) in enumerate(items)
+    ]
+    return await _run_batch(requests, LearningPlan) if requests else []
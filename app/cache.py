@@ -0,0 +1,303 @@
+import asyncio
+import logging
+import math
+import operator
+import os
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import TYPE_CHECKING, Any, Callable, Hashable, Optional
+
+if TYPE_CHECKING:
+    from langchain_openai import OpenAIEmbeddings
+
+logger = logging.getLogger(__name__)
+
+# Cache settings
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_MODEL = os.getenv("SEMANTIC_CACHE_MODEL", "text-embedding-3-small")
+# Embeddings kept per semantic group; each miss scans its group on the event loop,
+# so this stays well below LLM_CACHE_SIZE
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "256"))
+
+_embeddings: Optional["OpenAIEmbeddings"] = None
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and collapse whitespace so trivially different strings share a key"""
+    return " ".join(str(text).casefold().split())
+
+
+def score_bucket(score: float) -> int:
+    """Bucket a 0-100 score into deciles (100 shares the 90s bucket)"""
+    return min(int(score) // 10, 9)
+
+
+def _get_embeddings() -> Optional["OpenAIEmbeddings"]:
+    """Lazily create the embedding client; semantic lookups are skipped without an OpenAI key"""
+    global _embeddings
+    if _embeddings is None and os.getenv("OPENAI_API_KEY"):
+        # Imported on first use: langchain_openai adds a noticeable share of startup time
+        from langchain_openai import OpenAIEmbeddings
+        _embeddings = OpenAIEmbeddings(model=SEMANTIC_CACHE_MODEL)
+    return _embeddings
+
+
+def _unit(vector: list[float]) -> list[float]:
+    """Scale a vector to length 1, so cosine similarity is a plain dot product"""
+    norm = math.sqrt(sum(map(operator.mul, vector, vector)))
+    return [x / norm for x in vector] if norm else vector
+
+
+async def _embed(text: str) -> Optional[list[float]]:
+    """Embed text for a semantic lookup; None when embeddings are unavailable"""
+    vectors = await _embed_many([text])
+    return vectors[0] if vectors else None
+
+
+async def _embed_many(texts: list[str]) -> Optional[list[list[float]]]:
+    """Embed several texts in one request as unit vectors; None when embeddings are unavailable"""
+    embeddings = _get_embeddings()
+    if embeddings is None:
+        return None
+    try:
+        vectors = await embeddings.aembed_documents(texts)
+    except Exception as e:
+        logger.warning("[Cache] Embedding failed, skipping semantic lookup: %s", e)
+        return None
+    return [_unit(vector) for vector in vectors]
+
+
+# Returned by lookups that find nothing, since None can be a cached value
+_MISS = object()
+
+
+def _similar(entries: list[tuple[list[float], Any, float]], vector: list[float], threshold: float) -> Any:
+    """Value of the unexpired entry most similar to vector if at least threshold-similar, or _MISS"""
+    now = time.monotonic()
+    best_value, best_score = _MISS, threshold
+    for cached_vector, cached_value, expires_at in entries:
+        if expires_at > now:
+            score = sum(map(operator.mul, vector, cached_vector))
+            if score >= best_score:
+                best_value, best_score = cached_value, score
+    return best_value
+
+
+def llm_cache(
+    key: Callable[..., Hashable],
+    semantic: Optional[Callable[..., tuple[Hashable, str]]] = None,
+    maxsize: int = LLM_CACHE_SIZE,
+    ttl: Optional[float] = None,
+    threshold: float = SEMANTIC_CACHE_THRESHOLD,
+    semantic_maxsize: int = SEMANTIC_CACHE_SIZE
+):
+    """
+    Cache the results of an async LLM-backed function in process memory
+
+    Lookups try an exact match on the normalized key first. When a semantic
+    extractor is given, misses fall back to an embedding similarity search over
+    earlier texts in the same group, so paraphrased inputs reuse the result of the
+    closest one.
+    Concurrent calls with the same key share a single in-flight request.
+
+    Args:
+        key: Builds the exact-match key from the wrapped function's arguments
+        semantic: Optional; returns (group, text) where text is embedded and only
+                  compared against entries cached under the same group
+        maxsize: Maximum number of exact entries kept (least recently used evicted)
+        ttl: Optional; seconds before an entry expires
+        threshold: Minimum cosine similarity for a semantic hit
+        semantic_maxsize: Maximum number of embeddings kept per group (oldest evicted)
+
+    Returns:
+        A decorator for async functions
+
+    Example:
+        >>> @llm_cache(key=lambda question, answer: (question, normalize_text(answer)))
+        ... async def grade(question: str, answer: str) -> bool:
+        ...     ...
+    """
+    def decorator(func):
+        exact: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        groups: dict[Hashable, list[tuple[list[float], Any, float]]] = {}
+        in_flight: dict[Hashable, asyncio.Future] = {}
+
+        def expires() -> float:
+            return time.monotonic() + ttl if ttl is not None else math.inf
+
+        async def compute(cache_key: Hashable, args, kwargs) -> Any:
+            vector = None
+            if semantic is not None:
+                group, text = semantic(*args, **kwargs)
+                vector = await _embed(text)
+                if vector is not None:
+                    hit = _similar(groups.get(group, []), vector, threshold)
+                    if hit is not _MISS:
+                        logger.debug("[Cache] Semantic hit for %s", func.__name__)
+                        return hit
+
+            value = await func(*args, **kwargs)
+
+            if vector is not None:
+                entries = groups.setdefault(group, [])
+                entries.append((vector, value, expires()))
+                del entries[:-semantic_maxsize]
+            return value
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs)
+            if cache_key in exact:
+                value, expires_at = exact[cache_key]
+                if expires_at > time.monotonic():
+                    exact.move_to_end(cache_key)
+                    logger.debug("[Cache] Exact hit for %s", func.__name__)
+                    return value
+                del exact[cache_key]
+
+            if cache_key in in_flight:
+                return await asyncio.shield(in_flight[cache_key])
+
+            future = asyncio.ensure_future(compute(cache_key, args, kwargs))
+            in_flight[cache_key] = future
+            try:
+                value = await asyncio.shield(future)
+            finally:
+                in_flight.pop(cache_key, None)
+
+            exact[cache_key] = (value, expires())
+            if len(exact) > maxsize:
+                exact.popitem(last=False)
+            return value
+
+        wrapper.cache_clear = lambda: (exact.clear(), groups.clear())
+        return wrapper
+
+    return decorator
+
+
+def batch_llm_cache(
+    key: Callable[..., Hashable],
+    semantic: Optional[Callable[..., tuple[Hashable, str]]] = None,
+    maxsize: int = LLM_CACHE_SIZE,
+    ttl: Optional[float] = None,
+    threshold: float = SEMANTIC_CACHE_THRESHOLD,
+    semantic_maxsize: int = SEMANTIC_CACHE_SIZE
+):
+    """
+    Cache the per-item results of an async function that evaluates a list of items at once
+
+    The wrapped function takes a list of argument tuples and returns one result per
+    tuple, in order. Each item is cached on its own, like llm_cache: exact hits and
+    semantic hits (embedded in a single request) are answered from the cache, items
+    already being computed by a concurrent call are awaited, and only the remaining
+    items are passed to the function, in one call.
+
+    Args:
+        key: Builds the exact-match key from one item's arguments
+        semantic: Optional; returns (group, text) for one item, as in llm_cache
+        maxsize: Maximum number of exact entries kept (least recently used evicted)
+        ttl: Optional; seconds before an entry expires
+        threshold: Minimum cosine similarity for a semantic hit
+        semantic_maxsize: Maximum number of embeddings kept per group (oldest evicted)
+
+    Returns:
+        A decorator for async functions taking and returning lists
+
+    Example:
+        >>> @batch_llm_cache(key=lambda question, answer: (question, normalize_text(answer)))
+        ... async def grade_all(items: list[tuple[str, str]]) -> list[bool]:
+        ...     ...
+    """
+    def decorator(func):
+        exact: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        groups: dict[Hashable, list[tuple[list[float], Any, float]]] = {}
+        in_flight: dict[Hashable, asyncio.Future] = {}
+
+        def expires() -> float:
+            return time.monotonic() + ttl if ttl is not None else math.inf
+
+        def cached(cache_key: Hashable) -> Any:
+            if cache_key in exact:
+                value, expires_at = exact[cache_key]
+                if expires_at > time.monotonic():
+                    exact.move_to_end(cache_key)
+                    return value
+                del exact[cache_key]
+            return _MISS
+
+        async def compute(pending: dict[Hashable, tuple]) -> dict[Hashable, Any]:
+            values: dict[Hashable, Any] = {}
+            vectors: dict[Hashable, tuple[Hashable, list[float]]] = {}
+            if semantic is not None:
+                texts = {cache_key: semantic(*item) for cache_key, item in pending.items()}
+                embedded = await _embed_many([text for _, text in texts.values()])
+                for (cache_key, (group, _)), vector in zip(texts.items(), embedded or []):
+                    hit = _similar(groups.get(group, []), vector, threshold)
+                    if hit is _MISS:
+                        vectors[cache_key] = (group, vector)
+                    else:
+                        values[cache_key] = hit
+                if values:
+                    logger.debug("[Cache] %d semantic hits for %s", len(values), func.__name__)
+
+            misses = [cache_key for cache_key in pending if cache_key not in values]
+            if misses:
+                results = await func([pending[cache_key] for cache_key in misses])
+                if len(results) != len(misses):
+                    raise ValueError(f"{func.__name__} returned {len(results)} results for {len(misses)} items")
+                for cache_key, value in zip(misses, results):
+                    values[cache_key] = value
+                    if cache_key in vectors:
+                        group, vector = vectors[cache_key]
+                        entries = groups.setdefault(group, [])
+                        entries.append((vector, value, expires()))
+                        del entries[:-semantic_maxsize]
+
+            for cache_key, value in values.items():
+                exact[cache_key] = (value, expires())
+                exact.move_to_end(cache_key)
+            while len(exact) > maxsize:
+                exact.popitem(last=False)
+            return values
+
+        @wraps(func)
+        async def wrapper(items: list[tuple]) -> list[Any]:
+            keys = [key(*item) for item in items]
+            results: dict[Hashable, Any] = {}
+            waiting: dict[Hashable, asyncio.Future] = {}
+            pending: dict[Hashable, tuple] = {}
+            for cache_key, item in zip(keys, items):
+                if cache_key in results or cache_key in waiting or cache_key in pending:
+                    continue
+                value = cached(cache_key)
+                if value is not _MISS:
+                    results[cache_key] = value
+                elif cache_key in in_flight:
+                    waiting[cache_key] = in_flight[cache_key]
+                else:
+                    pending[cache_key] = item
+            if results:
+                logger.debug("[Cache] %d exact hits for %s", len(results), func.__name__)
+
+            if pending:
+                future = asyncio.ensure_future(compute(pending))
+                for cache_key in pending:
+                    in_flight[cache_key] = future
+                try:
+                    results.update(await asyncio.shield(future))
+                finally:
+                    for cache_key in pending:
+                        if in_flight.get(cache_key) is future:
+                            del in_flight[cache_key]
+
+            for cache_key, future in waiting.items():
+                results[cache_key] = (await asyncio.shield(future))[cache_key]
+            return [results[cache_key] for cache_key in keys]
+
+        wrapper.cache_clear = lambda: (exact.clear(), groups.clear())
+        return wrapper
+
+    return decorator
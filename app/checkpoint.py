@@ -0,0 +1,90 @@
+import os
+import zlib
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, AsyncIterator, Optional
+
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+if TYPE_CHECKING:
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+
+# Checkpoint compression settings
+CHECKPOINT_COMPRESSION = os.getenv("CHECKPOINT_COMPRESSION", "0") == "1"
+CHECKPOINT_COMPRESSION_MIN_BYTES = int(os.getenv("CHECKPOINT_COMPRESSION_MIN_BYTES", "512"))
+CHECKPOINT_COMPRESSION_LEVEL = int(os.getenv("CHECKPOINT_COMPRESSION_LEVEL", "6"))
+
+# Bytes of the checkpoint database SQLite may read through a memory map instead of read()
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 << 20)))
+
+# Applied to the SQLite checkpoint connection: WAL with synchronous=NORMAL syncs once per
+# WAL checkpoint instead of on every commit, and readers no longer wait on writers
+SQLITE_PRAGMAS = f"""
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA busy_timeout=5000;
+PRAGMA temp_store=MEMORY;
+PRAGMA cache_size=-20000;
+PRAGMA mmap_size={SQLITE_MMAP_SIZE};
+"""
+
+# Appended to the inner serializer's type tag so compressed and plain blobs can share a store
+ZLIB_SUFFIX = "+zlib"
+
+
+class CompressedSerializer(SerializerProtocol):
+    """
+    Checkpoint serializer that zlib-compresses large blobs from another serializer
+
+    Plans, lectures, quizzes and assignments repeat the same field names and enum
+    values throughout, so their msgpack payloads typically shrink by half or more.
+    Blobs under min_bytes are stored as is. Blobs written without compression
+    still load, so this can be switched on for an existing checkpoint store.
+    """
+
+    def __init__(
+        self,
+        serde: Optional[SerializerProtocol] = None,
+        min_bytes: int = CHECKPOINT_COMPRESSION_MIN_BYTES,
+        level: int = CHECKPOINT_COMPRESSION_LEVEL
+    ):
+        self.serde = serde or JsonPlusSerializer()
+        self.min_bytes = min_bytes
+        self.level = level
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(obj)
+        if len(data) < self.min_bytes:
+            return type_, data
+        return type_ + ZLIB_SUFFIX, zlib.compress(data, self.level)
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if type_.endswith(ZLIB_SUFFIX):
+            type_, payload = type_[:-len(ZLIB_SUFFIX)], zlib.decompress(payload)
+        return self.serde.loads_typed((type_, payload))
+
+
+def checkpoint_serde() -> SerializerProtocol:
+    """Serializer for the graph's checkpointer; compressed when CHECKPOINT_COMPRESSION=1"""
+    return CompressedSerializer() if CHECKPOINT_COMPRESSION else JsonPlusSerializer()
+
+
+@asynccontextmanager
+async def sqlite_checkpointer(db_path: str) -> AsyncIterator["AsyncSqliteSaver"]:
+    """
+    Open a SQLite checkpointer at db_path for the duration of the context
+
+    The connection gets SQLITE_PRAGMAS and the checkpointer uses checkpoint_serde().
+    Missing parent directories of db_path are created.
+    """
+    import aiosqlite
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    async with aiosqlite.connect(db_path) as conn:
+        await conn.executescript(SQLITE_PRAGMAS)
+        checkpointer = AsyncSqliteSaver(conn, serde=checkpoint_serde())
+        await checkpointer.setup()
+        yield checkpointer
@@ -1,11 +1,20 @@
 """
 LangGraph workflow for the Professor Agent
 """
+import asyncio
+import contextvars
+import logging
+import os
+import re
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import islice
 from langgraph.graph import StateGraph, END, add_messages
 from typing import Literal, Optional, Annotated
 from typing_extensions import TypedDict
 from langgraph.checkpoint.memory import InMemorySaver
 from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableConfig
 from app.agents import (
     create_learning_plan,
     create_lecture,
@@ -13,15 +22,18 @@ from app.agents import (
     extract_topic_and_background,
     create_assignment as create_assignment_agent,
     grade_assignment as grade_assignment_agent,
-    check_progress as check_progress_agent,
-    create_repeat_message,
-    create_advance_message,
-    evaluate_short_answer
+    evaluate_progress,
+    evaluate_short_answers_batch,
+    parse_quiz_answers,
+    parse_assignment_submission,
+    use_prefetch_budget
+)
+from app.cache import normalize_text
+from app.checkpoint import checkpoint_serde
+from app.models import (
+    LearningPlan, Lecture, Quiz, Assignment, GradingResult, ProgressDecision,
+    RepeatMessage, AdvanceMessage, QuestionType
 )
-from app.models import LearningPlan, Lecture, Quiz, Assignment, GradingResult, ProgressDecision
-from dotenv import load_dotenv
-
-load_dotenv()
 
 
 class LearningState(TypedDict, total=False):
@@ -42,6 +54,9 @@ class LearningState(TypedDict, total=False):
     assignment_submission: str
     assignment_score: int
     grading_result: Optional[GradingResult]
+    progress_decision: Optional[ProgressDecision]
+    repeat_message: Optional[RepeatMessage]  # Drafted alongside the progress decision
+    advance_message: Optional[AdvanceMessage]  # Drafted alongside the progress decision
     weak_points: list[str]
     attempt_count: int
     message: str
@@ -50,24 +65,265 @@ class LearningState(TypedDict, total=False):
     input_type: Optional[str]  # "quiz" or "assignment"
 
 
+logger = logging.getLogger(__name__)
+
+# Separates the verbose parsing/grading traces logged at DEBUG level
+DEBUG_DIVIDER = "=" * 70
+
+# Number of quiz weak points carried into the assignment
+MAX_WEAK_POINTS = 3
+
+# Multiple choice option labels, matching the letters stored in correct_answer
+OPTION_LETTERS = ("A", "B", "C", "D")
+
+# Accepted true/false answers (uppercased) and the boolean each one means
+TRUE_FALSE_ANSWERS = {"T": True, "TRUE": True, "F": False, "FALSE": False}
+
+# Fixed chat replies. Kept as strings rather than shared AIMessage objects because
+# add_messages assigns an id to each message in place
+NEW_QUERY_MESSAGE = "I couldn't understand your request. Please provide more details about what you'd like to learn and your background."
+COURSE_COMPLETE_MESSAGE = "# 🎓 Congratulations!\n\nYou've completed all lessons! You've demonstrated excellent progress and mastery of the material. Well done! 🎉"
+NO_QUIZ_ANSWERS_MESSAGE = "⚠️ No quiz answers received. Please try again."
+NO_SUBMISSION_MESSAGE = "⚠️ No submission received. Please submit your assignment to continue."
+
+
 # Helper function to create AI messages
-from langchain_core.messages import AIMessage
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage
 
 def create_ai_message(content: str) -> AIMessage:
     """Helper to create AI messages for the chat UI"""
     return AIMessage(content=content)
 
 
+def last_human_message(messages: list[BaseMessage]) -> Optional[HumanMessage]:
+    """The student's most recent message, scanning from the end of the history"""
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            return message
+    return None
+
+
+# Messages kept when a lesson attempt ends; earlier lectures, quizzes and submissions
+# are removed from state so checkpoints don't grow with the length of the course
+MESSAGES_KEPT_BETWEEN_LESSONS = int(os.getenv("MESSAGES_KEPT_BETWEEN_LESSONS", "2"))
+
+
+def drop_old_messages(messages: list[BaseMessage]) -> list[RemoveMessage]:
+    """RemoveMessage entries for all but the last MESSAGES_KEPT_BETWEEN_LESSONS messages"""
+    stale = messages[:-MESSAGES_KEPT_BETWEEN_LESSONS] if MESSAGES_KEPT_BETWEEN_LESSONS > 0 else messages
+    return [RemoveMessage(id=m.id) for m in stale if m.id]
+
+
+# Speculative agent calls started while the student is busy answering, keyed by
+# thread and call arguments. Tasks can't be checkpointed, so they live here
+# rather than in LearningState.
+MAX_PREFETCH_TASKS = 256
+_prefetch_tasks: OrderedDict[tuple, asyncio.Task] = OrderedDict()
+
+
+def _prefetch_key(config: RunnableConfig, name: str, kwargs: dict) -> tuple:
+    thread_id = config.get("configurable", {}).get("thread_id", "")
+    return (thread_id, name, repr(sorted(kwargs.items())))
+
+
+def start_prefetch(config: RunnableConfig, name: str, func, speculative: bool = True, **kwargs) -> None:
+    """
+    Start func(**kwargs) in the background so a later node can pick up the result
+    
+    Speculative work (which the student may never need) waits on the shared prefetch
+    budget; pass speculative=False for work the student is about to wait on, so its
+    model calls keep the student's budget.
+    """
+    key = _prefetch_key(config, name, kwargs)
+    if key in _prefetch_tasks:
+        return
+    # Detach from the current run's context so the task doesn't write to its stream
+    context = contextvars.Context()
+    if speculative:
+        context.run(use_prefetch_budget)
+    _prefetch_tasks[key] = asyncio.create_task(func(**kwargs), context=context)
+    while len(_prefetch_tasks) > MAX_PREFETCH_TASKS:
+        _, stale_task = _prefetch_tasks.popitem(last=False)
+        stale_task.cancel()
+
+
+async def take_prefetched(config: RunnableConfig, name: str, **kwargs):
+    """Await a prefetched call with the same arguments; None if none was started or it failed"""
+    task = _prefetch_tasks.pop(_prefetch_key(config, name, kwargs), None)
+    if task is None or task.cancelled():
+        return None
+    try:
+        result = await task
+    except Exception as e:
+        logger.warning("Prefetched %s failed, generating again: %s", name, e)
+        return None
+    logger.info("⚡ Using prefetched %s", name)
+    return result
+
+
+def cancel_prefetch(config: RunnableConfig, name: str, **kwargs) -> None:
+    """Drop a prefetched call whose result is no longer wanted"""
+    task = _prefetch_tasks.pop(_prefetch_key(config, name, kwargs), None)
+    if task is not None:
+        task.cancel()
+
+
+# Assignments are drafted during the quiz against an assumed typical score, and only
+# used if the student didn't do much worse than that
+SPECULATIVE_QUIZ_PERFORMANCE = "Quiz not yet graded; assume typical performance (around 70%)"
+MIN_SCORE_FOR_PREFETCHED_ASSIGNMENT = 50
+
+
+def speculative_assignment_args(lesson, attempt_count: int) -> dict:
+    """Arguments for drafting an assignment before the quiz is graded"""
+    return {
+        "lesson_title": lesson.title,
+        "objectives": lesson.objectives,
+        "key_concepts": lesson.key_concepts,
+        "quiz_performance": SPECULATIVE_QUIZ_PERFORMANCE,
+        "attempt_count": attempt_count
+    }
+
+
+def lecture_args(learning_plan: LearningPlan, lesson_idx: int, weak_points: list[str]) -> dict:
+    """Arguments for create_lecture for a given lesson"""
+    lesson = learning_plan.lessons[lesson_idx]
+    return {
+        "lesson_title": lesson.title,
+        "objectives": lesson.objectives,
+        "key_concepts": lesson.key_concepts,
+        "current_knowledge": f"Lesson {lesson_idx + 1} of {len(learning_plan.lessons)}",
+        "weak_points": sorted(weak_points) if weak_points else None
+    }
+
+
+def choice_letter(question, answer) -> Optional[str]:
+    """
+    Option letter an answer picks: a letter on its own or followed by punctuation
+    ("b", "B) 42"), else the option whose text it matches ("Cannot tell" is not C)
+    """
+    answer = str(answer).strip()
+    match = CHOICE_ANSWER.fullmatch(answer)
+    if match:
+        return match.group(1).upper()
+    answer = normalize_text(answer)
+    for letter, option in zip(OPTION_LETTERS, question.options):
+        if normalize_text(option) == answer:
+            return letter
+    return None
+
+
+def grade_multiple_choice(question, user_answer) -> bool:
+    """Compare option letters, so "b", "B) ..." and B's option text all read as B"""
+    user_letter = choice_letter(question, user_answer)
+    return user_letter is not None and user_letter == choice_letter(question, question.correct_answer)
+
+
+def grade_true_false(question, user_answer) -> bool:
+    """Compare booleans; user input is a string like True, false or T"""
+    return TRUE_FALSE_ANSWERS.get(str(user_answer).strip().upper()) == question.correct_answer
+
+
+# Answers written as a bare list of letters or true/false, optionally numbered
+# ("1. B 2. True 3) c", "B, T, C, A, F"), and a submission that is only a code block
+QUICK_ANSWER = r"(?:q?\d+\s*[.):-]?\s*)?(true|false|[a-dtf])(?![a-z0-9])[\s,;]*"
+QUICK_ANSWERS = re.compile(rf"\s*(?:{QUICK_ANSWER})+", re.IGNORECASE)
+QUICK_ANSWER_TOKEN = re.compile(QUICK_ANSWER, re.IGNORECASE)
+FENCED_SUBMISSION = re.compile(r"\s*```[\w+-]*\n(.*?)\n?```\s*", re.DOTALL)
+
+# Answer numbers: "1.", "Q1:" or "Question 1)" at the start of a line, or "1." / "2)" mid-line.
+# The separator is required: short answers often contain numbers, and a line of a
+# multi-line answer starting "2 ..." must not be read as the next answer
+ANSWER_NUMBER = re.compile(
+    r"(?:^|(?<=\n))[ \t]*(?:q(?:uestion)?[ \t]*)?(\d+)[ \t]*[.):][ \t]*"
+    r"|(?<=\s)(?:q(?:uestion)?[ \t]*)?(\d+)[.):][ \t]+",
+    re.IGNORECASE
+)
+# A multiple choice answer is a letter, optionally followed by the option ("B", "b) 42");
+# a true/false answer may be followed by the student's reasoning ("False, because ...")
+CHOICE_ANSWER = re.compile(r"([a-d])(?:[.):]\s*.*)?", re.IGNORECASE | re.DOTALL)
+TRUE_FALSE_ANSWER = re.compile(r"(true|false|t|f)(?![a-z]).*", re.IGNORECASE | re.DOTALL)
+
+
+def split_numbered_answers(message: str, count: int) -> Optional[list[str]]:
+    """Split a message into the answers numbered 1 to count, or None if they aren't all there in order"""
+    bounds = []
+    for match in ANSWER_NUMBER.finditer(message):
+        if int(match.group(1) or match.group(2)) == len(bounds) + 1:
+            bounds.append((match.start(), match.end()))
+            if len(bounds) == count:
+                break
+    if len(bounds) != count:
+        return None
+    ends = [start for start, _ in bounds[1:]] + [len(message)]
+    return [message[start:end].strip(" \t\n,;") for (_, start), end in zip(bounds, ends)]
+
+
+def parse_quick_answers(message: str, quiz: Quiz) -> Optional[dict[str, str]]:
+    """
+    Read quiz answers without the parser agent when the message is unambiguous
+    
+    Handles a bare list of letters / true-false for quizzes without short answers,
+    and answers numbered 1 to N (one per line, or "1." / "2)" inline) for any quiz.
+    Returns None if any answer doesn't fit its question, so the LLM parser is used.
+    """
+    # A bare list has no way to carry a written answer, so short answers must be numbered
+    has_short_answers = any(question.type == QuestionType.SHORT_ANSWER for question in quiz.questions)
+    if not has_short_answers and QUICK_ANSWERS.fullmatch(message):
+        tokens = [match.group(1) for match in QUICK_ANSWER_TOKEN.finditer(message)]
+    else:
+        tokens = split_numbered_answers(message, len(quiz.questions))
+    if tokens is None or len(tokens) != len(quiz.questions):
+        return None
+    
+    answers = {}
+    for i, (question, token) in enumerate(zip(quiz.questions, tokens)):
+        if question.type == QuestionType.MULTIPLE_CHOICE:
+            match = CHOICE_ANSWER.fullmatch(token)
+            if not match:
+                return None
+            answers[f"q{i}"] = match.group(1).upper()
+        elif question.type == QuestionType.TRUE_FALSE:
+            match = TRUE_FALSE_ANSWER.fullmatch(token)
+            if not match:
+                return None
+            answers[f"q{i}"] = str(TRUE_FALSE_ANSWERS[match.group(1).upper()])
+        elif token:
+            answers[f"q{i}"] = token
+        else:
+            return None
+    return answers
+
+
+# Locally graded question types; short answers go through the LLM evaluator instead
+ANSWER_GRADERS = {
+    QuestionType.MULTIPLE_CHOICE: grade_multiple_choice,
+    QuestionType.TRUE_FALSE: grade_true_false
+}
+
+
+# Queries with fewer words than this can't name both a topic and a background
+MIN_QUERY_WORDS = 3
+
+
+def extraction_failed(topic: Optional[str], background: Optional[str]) -> bool:
+    """Whether the extractor couldn't find a topic or background (it reports "failed to detect")"""
+    for value in (topic, background):
+        value = (value or "").strip().casefold()
+        if not value or "failed" in value:
+            return True
+    return False
+
+
 async def extract_topic_and_background_node(state: LearningState) -> LearningState:
     """Extract the topic the user wants to learn along with their background"""
     # Get query from the last user message
     query = state.get("query", "")
     if not query and state.get("messages"):
-        # Extract from last message if query not provided
-        messages = state.get("messages", [])
-        if messages:
-            last_message = messages[-1]
-            content = last_message.content if hasattr(last_message, 'content') else str(last_message)
+        # Extract from the student's last message if query not provided
+        last_message = last_human_message(state["messages"])
+        if last_message:
+            content = last_message.content
             # Handle content being a list or dict
             if isinstance(content, list):
                 query = " ".join(str(item) for item in content)
@@ -76,88 +332,65 @@ async def extract_topic_and_background_node(state: LearningState) -> LearningSta
             else:
                 query = str(content)
     
-    if not query:
-        # If still no query, return error state
+    # Queries too short to name both a topic and a background skip the extraction call
+    inputs = await extract_topic_and_background(query) if len(query.split()) >= MIN_QUERY_WORDS else None
+    
+    if inputs is None or extraction_failed(inputs.topic, inputs.background):
+        # Clear the query so the retry reads the student's next message
         return {
-            **state,
             "query": "",
-            "topic": "failed to detect",
-            "background": "failed to detect",
-            "waiting_for_input": False
+            "topic": inputs.topic if inputs else "failed to detect",
+            "background": inputs.background if inputs else "failed to detect",
+            "waiting_for_input": True,
+            "input_type": "extraction_retry"
         }
     
-    inputs = await extract_topic_and_background(query)
     return {
-        **state,
         "query": query,
         "topic": inputs.topic,
         "background": inputs.background,
         "waiting_for_input": False  # Clear the flag after extraction
     }
 
-async def check_extraction_result(state: LearningState) -> LearningState:
-    """Checks if the result of the extraction was successful"""
-    # Check if extraction failed
-    topic = state.get("topic", "").strip()
-    background = state.get("background", "").strip()
-    
-    failed_values = ["failed to detect", "failed"]
-    topic_failed = not topic or any(fail in topic.lower() for fail in failed_values)
-    background_failed = not background or any(fail in background.lower() for fail in failed_values)
-    
-    # If extraction failed, set waiting_for_input flag
-    if topic_failed or background_failed:
-        return {
-            **state,
-            "waiting_for_input": True,
-            "input_type": "extraction_retry"
-        }
-    
-    return state
-
 
 async def request_new_query(state: LearningState) -> LearningState:
     """Request a new query from the user when extraction fails"""
-    error_msg = "I couldn't understand your request. Please provide more details about what you'd like to learn and your background."
     return {
-        **state,
-        "messages": [create_ai_message(error_msg)],
+        "messages": [create_ai_message(NEW_QUERY_MESSAGE)],
         "waiting_for_input": True,
         "input_type": "new_query",
-        "message": error_msg
+        "message": NEW_QUERY_MESSAGE
     }
 
 
 async def generate_learning_plan(state: LearningState) -> LearningState:
     """Generate a comprehensive learning plan for the topic"""
-    print(f"\n📚 Generating learning plan for: {state['topic']}")
+    logger.info("📚 Generating learning plan for: %s", state['topic'])
     
     learning_plan = await create_learning_plan(
         topic=state['topic'],
         background=state.get('background', 'No background provided')
     )
     
-    print(f"✓ Created plan with {len(learning_plan.lessons)} lessons")
+    logger.info("✓ Created plan with %d lessons", len(learning_plan.lessons))
     
     # Format learning plan for chat UI
-    plan_text = f"# 📚 Learning Plan: {learning_plan.topic}\n\n"
-    plan_text += f"**Total Duration:** {learning_plan.total_duration_minutes} minutes\n"
-    plan_text += f"**Difficulty Level:** {learning_plan.overall_difficulty.value}\n\n"
-    plan_text += "## Lessons\n\n"
+    plan_parts = [f"# 📚 Learning Plan: {learning_plan.topic}\n\n"]
+    plan_parts.append(f"**Total Duration:** {learning_plan.total_duration_minutes} minutes\n")
+    plan_parts.append(f"**Difficulty Level:** {learning_plan.overall_difficulty.value}\n\n")
+    plan_parts.append("## Lessons\n\n")
     
     for lesson in learning_plan.lessons:
-        plan_text += f"### Lesson {lesson.lesson_number}: {lesson.title}\n"
-        plan_text += f"**Duration:** {lesson.duration_minutes} min | **Difficulty:** {lesson.difficulty.value}\n\n"
-        plan_text += "**Objectives:**\n"
-        for obj in lesson.objectives:
-            plan_text += f"- {obj}\n"
-        plan_text += "\n"
+        plan_parts.append(f"### Lesson {lesson.lesson_number}: {lesson.title}\n")
+        plan_parts.append(f"**Duration:** {lesson.duration_minutes} min | **Difficulty:** {lesson.difficulty.value}\n\n")
+        plan_parts.append("**Objectives:**\n")
+        plan_parts.append(lesson.objectives_markdown)
+        plan_parts.append("\n")
     
-    plan_text += "\nLet's begin with the first lesson! 🚀"
+    plan_parts.append("\nLet's begin with the first lesson! 🚀")
     
     return {
-        **state,
-        "messages": [create_ai_message(plan_text)],
+        "messages": [create_ai_message("".join(plan_parts))],
         "learning_plan": learning_plan,
         "current_lesson_idx": 0,
         "attempt_count": 0,
@@ -177,35 +410,51 @@ async def check_progress_node(state: LearningState) -> LearningState:
     
     # Check if we've completed all lessons
     if current_idx >= len(learning_plan.lessons):
-        completion_msg = "# 🎓 Congratulations!\n\nYou've completed all lessons! You've demonstrated excellent progress and mastery of the material. Well done! 🎉"
-        print("\n🎓 Congratulations! You've completed all lessons!")
+        logger.info("🎓 Congratulations! You've completed all lessons!")
         return {
-            **state,
-            "messages": [create_ai_message(completion_msg)],
+            "messages": [create_ai_message(COURSE_COMPLETE_MESSAGE)],
             "completed": True,
             "message": "Course completed successfully!",
             "waiting_for_input": False
         }
     
     current_lesson = learning_plan.lessons[current_idx]
-    lesson_intro = f"## 📖 Lesson {current_idx + 1}/{len(learning_plan.lessons)}: {current_lesson.title}\n\n"
-    lesson_intro += f"**Duration:** {current_lesson.duration_minutes} minutes\n"
-    lesson_intro += f"**Difficulty:** {current_lesson.difficulty.value}\n\n"
-    lesson_intro += "**Learning Objectives:**\n"
-    for obj in current_lesson.objectives:
-        lesson_intro += f"- {obj}\n"
-    lesson_intro += "\nLet's get started! 📚"
+    intro_parts = [f"## 📖 Lesson {current_idx + 1}/{len(learning_plan.lessons)}: {current_lesson.title}\n\n"]
+    intro_parts.append(f"**Duration:** {current_lesson.duration_minutes} minutes\n")
+    intro_parts.append(f"**Difficulty:** {current_lesson.difficulty.value}\n\n")
+    intro_parts.append("**Learning Objectives:**\n")
+    intro_parts.append(current_lesson.objectives_markdown)
+    intro_parts.append("\nLet's get started! 📚")
     
-    print(f"\n📖 Lesson {current_idx + 1}/{len(learning_plan.lessons)}: {current_lesson.title}")
+    logger.info("📖 Lesson %d/%d: %s", current_idx + 1, len(learning_plan.lessons), current_lesson.title)
     
     return {
-        **state,
-        "messages": [create_ai_message(lesson_intro)],
+        "messages": [create_ai_message("".join(intro_parts))],
         "waiting_for_input": False
     }
 
 
-async def give_lecture(state: LearningState) -> LearningState:
+# Quizzes are written from the lesson plan rather than the finished lecture, so they
+# can be generated alongside it; set QUIZ_FROM_LESSON_PLAN=false to ground them on the lecture
+QUIZ_FROM_LESSON_PLAN = os.getenv("QUIZ_FROM_LESSON_PLAN", "true").lower() == "true"
+
+
+def quiz_args(lesson, attempt_count: int, weak_points: list[str], lecture: Optional[Lecture] = None) -> dict:
+    """Arguments for create_quiz, grounded on the lecture when one is given"""
+    return {
+        "attempt_count": attempt_count,
+        "weak_points": sorted(weak_points) if weak_points else None,
+        "lesson_title": lesson.title,
+        "objectives": lesson.objectives,
+        "key_concepts": lesson.key_concepts,
+        "lecture_summary": lecture.summary if lecture else (
+            f"The lecture covers these objectives: {'; '.join(lesson.objectives)}. "
+            f"Key concepts: {', '.join(lesson.key_concepts)}."
+        )
+    }
+
+
+async def give_lecture(state: LearningState, config: RunnableConfig) -> LearningState:
     """Deliver a lecture for the current lesson"""
     learning_plan = state['learning_plan']
     if not learning_plan:
@@ -213,44 +462,47 @@ async def give_lecture(state: LearningState) -> LearningState:
         
     current_lesson = learning_plan.lessons[state['current_lesson_idx']]
     
-    print(f"\n🎤 Delivering lecture: {current_lesson.title}")
+    logger.info("🎤 Delivering lecture: %s", current_lesson.title)
     
-    lecture = await create_lecture(
-        lesson_title=current_lesson.title,
-        objectives=current_lesson.objectives,
-        key_concepts=current_lesson.key_concepts,
-        current_knowledge=f"Lesson {state['current_lesson_idx'] + 1} of {len(learning_plan.lessons)}",
-        weak_points=state['weak_points'] if state['weak_points'] else None
+    # The quiz only needs the lesson plan, so it is generated while the lecture is written
+    if QUIZ_FROM_LESSON_PLAN:
+        start_prefetch(
+            config, "quiz", create_quiz, speculative=False,
+            **quiz_args(current_lesson, state['attempt_count'], state['weak_points'])
+        )
+    
+    # Picks up the lecture prefetched during the previous lesson's quiz when the inputs match
+    lecture_kwargs = lecture_args(learning_plan, state['current_lesson_idx'], state['weak_points'])
+    lecture = (
+        await take_prefetched(config, "lecture", **lecture_kwargs)
+        or await create_lecture(**lecture_kwargs)
     )
     
-    print(f"✓ Lecture created with {len(lecture.segments)} segments")
+    logger.info("✓ Lecture created with %d segments", len(lecture.segments))
     
     # Format lecture content for chat UI
-    lecture_text = f"# {lecture.lesson_title}\n\n"
-    lecture_text += f"## Introduction\n\n{lecture.introduction}\n\n"
+    lecture_parts = [f"# {lecture.lesson_title}\n\n"]
+    lecture_parts.append(f"## Introduction\n\n{lecture.introduction}\n\n")
     
     for segment in lecture.segments:
-        lecture_text += f"{segment.content}\n\n"
+        lecture_parts.append(f"{segment.content}\n\n")
         if segment.interaction_points:
-            lecture_text += "**Think About This:**\n"
-            for point in segment.interaction_points:
-                lecture_text += f"- {point}\n"
-            lecture_text += "\n"
+            lecture_parts.append("**Think About This:**\n")
+            lecture_parts.extend(f"- {point}\n" for point in segment.interaction_points)
+            lecture_parts.append("\n")
     
-    lecture_text += f"## Conclusion\n\n{lecture.conclusion}\n\n"
-    lecture_text += "**Key Takeaways:**\n"
-    for takeaway in lecture.key_takeaways:
-        lecture_text += f"- {takeaway}\n"
+    lecture_parts.append(f"## Conclusion\n\n{lecture.conclusion}\n\n")
+    lecture_parts.append("**Key Takeaways:**\n")
+    lecture_parts.extend(f"- {takeaway}\n" for takeaway in lecture.key_takeaways)
     
     return {
-        **state,
-        "messages": [create_ai_message(lecture_text)],
+        "messages": [create_ai_message("".join(lecture_parts))],
         "lecture_content": lecture,
         "waiting_for_input": False
     }
 
 
-async def administer_quiz(state: LearningState) -> LearningState:
+async def administer_quiz(state: LearningState, config: RunnableConfig) -> LearningState:
     """Create and present a quiz based on the lecture"""
     learning_plan = state['learning_plan']
     lecture = state['lecture_content']
@@ -259,37 +511,42 @@ async def administer_quiz(state: LearningState) -> LearningState:
         
     current_lesson = learning_plan.lessons[state['current_lesson_idx']]
     
-    print(f"\n📝 Creating quiz for: {current_lesson.title}")
+    logger.info("📝 Creating quiz for: %s", current_lesson.title)
     
-    # Create a lecture summary for the quiz
-    lecture_summary = f"{lecture.introduction}\n" + "\n".join([
-        f"{seg.title}: {seg.content[:200]}..." for seg in lecture.segments
-    ])
+    if QUIZ_FROM_LESSON_PLAN:
+        quiz_kwargs = quiz_args(current_lesson, state['attempt_count'], state['weak_points'])
+        quiz = (
+            await take_prefetched(config, "quiz", **quiz_kwargs)
+            or await create_quiz(**quiz_kwargs)
+        )
+    else:
+        quiz = await create_quiz(**quiz_args(current_lesson, state['attempt_count'], state['weak_points'], lecture))
     
-    quiz = await create_quiz(
-        lesson_title=current_lesson.title,
-        objectives=current_lesson.objectives,
-        key_concepts=current_lesson.key_concepts,
-        lecture_summary=lecture_summary
-    )
+    logger.info("✓ Quiz created with %d questions", len(quiz.questions))
     
-    print(f"✓ Quiz created with {len(quiz.questions)} questions")
+    # Start the next lesson's lecture while the student answers; if they advance it
+    # starts without weak points, so it matches what give_lecture will ask for
+    next_idx = state['current_lesson_idx'] + 1
+    if next_idx < len(learning_plan.lessons):
+        start_prefetch(config, "lecture", create_lecture, **lecture_args(learning_plan, next_idx, []))
+    start_prefetch(
+        config, "assignment", create_assignment_agent,
+        **speculative_assignment_args(current_lesson, state['attempt_count'])
+    )
     
     # Format quiz for chat UI
-    quiz_text = f"## Quiz Time! 📝\n\n"
+    quiz_parts = ["## Quiz Time! 📝\n\n"]
     for i, q in enumerate(quiz.questions, 1):
-        quiz_text += f"**Question {i}:** {q.question}\n\n"
+        quiz_parts.append(f"**Question {i}:** {q.question}\n\n")
         # Check question type using the type field
-        from app.models import QuestionType
         if q.type == QuestionType.MULTIPLE_CHOICE and hasattr(q, 'options'):
-            for i, opt in enumerate(q.options):
-                quiz_text += f"- {i+1}. {opt}\n"
-        quiz_text += "\n"
+            # Label options with the letters the answer parser and grader expect
+            quiz_parts.extend(f"- {letter}. {opt}\n" for letter, opt in zip(OPTION_LETTERS, q.options))
+        quiz_parts.append("\n")
     
     # Set waiting_for_input to pause for user answers
     return {
-        **state,
-        "messages": [create_ai_message(quiz_text)],
+        "messages": [create_ai_message("".join(quiz_parts))],
         "quiz_results": quiz,
         "waiting_for_input": True,
         "input_type": "quiz"
@@ -310,9 +567,9 @@ async def process_quiz_answers(state: LearningState) -> LearningState:
     
     if not answers and messages and quiz:
         # Find the last human message
-        human_messages = [m for m in messages if hasattr(m, 'type') and m.type == 'human']
-        if human_messages:
-            msg_content = human_messages[-1].content
+        human_message = last_human_message(messages)
+        if human_message:
+            msg_content = human_message.content
             # Handle content that could be string or list
             raw_message = msg_content if isinstance(msg_content, str) else str(msg_content)
             
@@ -321,35 +578,35 @@ async def process_quiz_answers(state: LearningState) -> LearningState:
                 f"{i+1}. {q.question}" for i, q in enumerate(quiz.questions)
             ])
             
-            print(f"\n{'='*70}")
-            print(f"DEBUG: Parsing quiz answers from message")
-            print(f"Raw message: {raw_message[:200]}...")
-            print(f"{'='*70}\n")
+            logger.debug(
+                "\n%s\nParsing quiz answers from message\nRaw message: %.200s...\n%s",
+                DEBUG_DIVIDER, raw_message, DEBUG_DIVIDER
+            )
             
-            # Parse the answers from natural language
-            from app.agents import parse_quiz_answers
+            # Parse the answers from natural language, unless they're a plain or numbered list
             try:
-                answers = await parse_quiz_answers(raw_message, quiz_questions_str)
-                print(f"Parsed answers: {answers}")
+                answers = (
+                    parse_quick_answers(raw_message, quiz)
+                    or await parse_quiz_answers(raw_message, quiz_questions_str)
+                )
+                logger.info("Parsed answers: %s", answers)
             except Exception as e:
-                print(f"Error parsing quiz answers: {e}")
+                logger.error("Error parsing quiz answers: %s", e)
                 answers = {}
     
-    print(f"\n{'='*70}")
-    print(f"DEBUG: Processing quiz answers")
-    print(f"Quiz exists: {quiz is not None}")
-    print(f"Answers dict: {answers}")
-    print(f"Answers type: {type(answers)}")
-    print(f"Number of answers: {len(answers) if isinstance(answers, dict) else 'Not a dict!'}")
-    print(f"{'='*70}\n")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "\n%s\nProcessing quiz answers\nQuiz exists: %s\nAnswers dict: %s\n"
+            "Answers type: %s\nNumber of answers: %s\n%s",
+            DEBUG_DIVIDER, quiz is not None, answers, type(answers),
+            len(answers) if isinstance(answers, dict) else 'Not a dict!', DEBUG_DIVIDER
+        )
     
     if not quiz or not answers:
         # If no answers provided, assign a low score
-        print(f"ERROR: Missing quiz or answers - quiz={quiz is not None}, answers={answers is not None}")
-        error_msg = "⚠️ No quiz answers received. Please try again."
+        logger.error("Missing quiz or answers - quiz=%s, answers=%s", quiz is not None, bool(answers))
         return {
-            **state,
-            "messages": [create_ai_message(error_msg)],
+            "messages": [create_ai_message(NO_QUIZ_ANSWERS_MESSAGE)],
             "quiz_score": 0,
             "waiting_for_input": False
         }
@@ -357,83 +614,74 @@ async def process_quiz_answers(state: LearningState) -> LearningState:
     # Calculate score based on correct answers
     correct_count = 0
     total_questions = len(quiz.questions)
-    weak_points = []
-    results_text = "## 📊 Quiz Results\n\n"
-    
-    print(f"Grading quiz with {total_questions} questions...")
+    weak_points: dict[str, None] = {}  # Ordered set, so repeated wrong answers don't crowd out others
+    results_parts = ["## 📊 Quiz Results\n\n"]
+    
+    logger.info("Grading quiz with %d questions...", total_questions)
+    
+    # Evaluate all short answers together; verdicts for answers seen before come from its cache
+    short_answers = [i for i, question in enumerate(quiz.questions) if question.type == QuestionType.SHORT_ANSWER]
+    short_answer_results = {}
+    # MC/TF-only quizzes are graded without awaiting anything
+    if short_answers:
+        short_answer_evaluations = await evaluate_short_answers_batch([
+            (quiz.questions[i].question, quiz.questions[i].key_points, str(answers.get(f"q{i}", "")))
+            for i in short_answers
+        ])
+        short_answer_results = {
+            i: evaluation.is_correct for i, evaluation in zip(short_answers, short_answer_evaluations)
+        }
     
     for i, question in enumerate(quiz.questions):
         user_answer = answers.get(f"q{i}", "")
         
-        # Handle different question types
-        is_correct = False
-        
-        # Get the enum value for comparison
-        from app.models import QuestionType
-        
-        if question.type == QuestionType.MULTIPLE_CHOICE:
-            # Multiple choice: compare letters (A, B, C, D)
-            correct_answer = str(question.correct_answer).strip().upper()
-            user_answer_clean = str(user_answer).strip().upper()
-            is_correct = user_answer_clean == correct_answer
-            print(f"Q{i+1} [MC]: User='{user_answer_clean}' Correct='{correct_answer}' Match={is_correct}")
-        
-        elif question.type == QuestionType.TRUE_FALSE:
-            # True/False: compare boolean values
-            # User input is string "True" or "False", correct_answer is bool
-            correct_answer_bool = question.correct_answer
-            user_answer_bool = str(user_answer).strip().lower() == "true"
-            is_correct = user_answer_bool == correct_answer_bool
-            print(f"Q{i+1} [T/F]: User='{user_answer}' -> {user_answer_bool}, Correct={correct_answer_bool} Match={is_correct}")
-        
-        elif question.type == QuestionType.SHORT_ANSWER:
-            # Short answer: use LLM evaluator for sophisticated grading
-            is_correct = await evaluate_short_answer(
-                question=question.question,
-                key_points=question.key_points,
-                student_answer=str(user_answer)
-            )
-            print(f"Q{i+1} [SA]: User='{user_answer[:30]}...' Match={is_correct}")
-        
+        # Short answers were graded by the batched LLM evaluator above
+        grader = ANSWER_GRADERS.get(question.type)
+        if i in short_answer_results:
+            is_correct = short_answer_results[i]
+        elif grader:
+            is_correct = grader(question, user_answer)
         else:
-            print(f"WARNING: Unknown question type: {question.type}")
+            is_correct = False
+            logger.warning("Unknown question type: %s", question.type)
+        
+        logger.debug("Q%d [%s]: User='%.30s' Match=%s", i + 1, question.type.value, user_answer, is_correct)
         
         # Add to results display
         status = "✅" if is_correct else "❌"
-        results_text += f"{status} **Question {i+1}:** {question.question}\n"
-        results_text += f"   Your answer: {user_answer}\n\n"
+        results_parts.append(f"{status} **Question {i+1}:** {question.question}\n")
+        results_parts.append(f"   Your answer: {user_answer}\n\n")
         
         if is_correct:
             correct_count += 1
         else:
             # Track weak points for wrong answers
-            weak_points.append(question.question[:50])  # First 50 chars
+            weak_points.setdefault(question.question[:50])  # First 50 chars
     
     score = int((correct_count / total_questions) * 100) if total_questions > 0 else 0
     
-    print(f"✓ Quiz scored: {score}% ({correct_count}/{total_questions} correct)")
+    logger.info("✓ Quiz scored: %d%% (%d/%d correct)", score, correct_count, total_questions)
     
     # Add score summary
-    results_text += f"\n### Final Score: {score}%\n"
-    results_text += f"You got {correct_count} out of {total_questions} questions correct.\n\n"
+    results_parts.append(f"\n### Final Score: {score}%\n")
+    results_parts.append(f"You got {correct_count} out of {total_questions} questions correct.\n\n")
     
     if score >= 80:
-        results_text += "🎉 Excellent work! You have a strong understanding of the material.\n"
+        results_parts.append("🎉 Excellent work! You have a strong understanding of the material.\n")
     elif score >= 60:
-        results_text += "👍 Good job! You're making progress.\n"
+        results_parts.append("👍 Good job! You're making progress.\n")
     else:
-        results_text += "💪 Keep practicing! Let's review some concepts.\n"
+        results_parts.append("💪 Keep practicing! Let's review some concepts.\n")
     
     return {
-        **state,
-        "messages": [create_ai_message(results_text)],
+        "messages": [create_ai_message("".join(results_parts))],
         "quiz_score": score,
-        "weak_points": weak_points[:3],  # Keep top 3 weak points
+        "weak_points": sorted(islice(weak_points, MAX_WEAK_POINTS)),
         "waiting_for_input": False
     }
 
 
-async def create_assignment_node(state: LearningState) -> LearningState:
+async def create_assignment_node(state: LearningState, config: RunnableConfig) -> LearningState:
     """Create an assignment based on the lesson and quiz performance"""
     learning_plan = state['learning_plan']
     if not learning_plan:
@@ -441,45 +689,53 @@ async def create_assignment_node(state: LearningState) -> LearningState:
         
     current_lesson = learning_plan.lessons[state['current_lesson_idx']]
     
-    print(f"\n📋 Creating assignment for: {current_lesson.title}")
+    logger.info("📋 Creating assignment for: %s", current_lesson.title)
     
     quiz_performance = f"Quiz score: {state['quiz_score']}%"
     if state['weak_points']:
         quiz_performance += f", Weak areas: {', '.join(state['weak_points'])}"
     
-    assignment = await create_assignment_agent(
-        lesson_title=current_lesson.title,
-        objectives=current_lesson.objectives,
-        key_concepts=current_lesson.key_concepts,
-        quiz_performance=quiz_performance
-    )
+    # Use the assignment drafted during the quiz unless the student struggled badly
+    assignment = None
+    speculative_kwargs = speculative_assignment_args(current_lesson, state['attempt_count'])
+    if state['quiz_score'] >= MIN_SCORE_FOR_PREFETCHED_ASSIGNMENT:
+        assignment = await take_prefetched(config, "assignment", **speculative_kwargs)
+    else:
+        cancel_prefetch(config, "assignment", **speculative_kwargs)
+    
+    if assignment is None:
+        assignment = await create_assignment_agent(
+            lesson_title=current_lesson.title,
+            objectives=current_lesson.objectives,
+            key_concepts=current_lesson.key_concepts,
+            quiz_performance=quiz_performance,
+            attempt_count=state['attempt_count']
+        )
     
-    print(f"✓ Assignment created: {assignment.title}")
+    logger.info("✓ Assignment created: %s", assignment.title)
     
     # Format assignment for chat UI
-    assignment_text = f"# 📋 {assignment.title}\n\n"
-    assignment_text += f"## 📖 Background\n{assignment.background}\n\n"
-    assignment_text += f"## 🎯 Objective\n{assignment.objective}\n\n"
-    assignment_text += f"## 📝 Instructions\n\n"
+    assignment_parts = [f"# 📋 {assignment.title}\n\n"]
+    assignment_parts.append(f"## 📖 Background\n{assignment.background}\n\n")
+    assignment_parts.append(f"## 🎯 Objective\n{assignment.objective}\n\n")
+    assignment_parts.append("## 📝 Instructions\n\n")
     
     for i, step in enumerate(assignment.steps, 1):
-        assignment_text += f"{i}. {step.instruction}\n"
+        assignment_parts.append(f"{i}. {step.instruction}\n")
         if step.expected_outcome:
-            assignment_text += f"   *Expected outcome: {step.expected_outcome}*\n"
+            assignment_parts.append(f"   *Expected outcome: {step.expected_outcome}*\n")
         if step.hints:
-            assignment_text += f"   💡 *Hint: {step.hints[0]}*\n"
-        assignment_text += "\n"
+            assignment_parts.append(f"   💡 *Hint: {step.hints[0]}*\n")
+        assignment_parts.append("\n")
     
-    assignment_text += f"## ✅ Success Criteria\n\n"
-    for criterion in assignment.success_criteria:
-        assignment_text += f"- {criterion}\n"
+    assignment_parts.append("## ✅ Success Criteria\n\n")
+    assignment_parts.extend(f"- {criterion}\n" for criterion in assignment.success_criteria)
     
-    assignment_text += "\n📤 Please submit your completed assignment when ready!"
+    assignment_parts.append("\n📤 Please submit your completed assignment when ready!")
     
     # Set waiting_for_input to pause for user submission
     return {
-        **state,
-        "messages": [create_ai_message(assignment_text)],
+        "messages": [create_ai_message("".join(assignment_parts))],
         "assignment": assignment,
         "waiting_for_input": True,
         "input_type": "assignment"
@@ -495,7 +751,7 @@ async def grade_assignment_node(state: LearningState) -> LearningState:
         
     current_lesson = learning_plan.lessons[state['current_lesson_idx']]
     
-    print(f"\n✏️ Grading assignment: {assignment.title}")
+    logger.info("✏️ Grading assignment: %s", assignment.title)
     
     # Try to parse submission from the last user message
     submission = state.get('assignment_submission', "") or ""
@@ -503,9 +759,9 @@ async def grade_assignment_node(state: LearningState) -> LearningState:
     
     if not submission and messages:
         # Find the last human message
-        human_messages = [m for m in messages if hasattr(m, 'type') and m.type == 'human']
-        if human_messages:
-            msg_content = human_messages[-1].content
+        human_message = last_human_message(messages)
+        if human_message:
+            msg_content = human_message.content
             # Handle content that could be string or list
             raw_message = msg_content if isinstance(msg_content, str) else str(msg_content)
             
@@ -513,27 +769,28 @@ async def grade_assignment_node(state: LearningState) -> LearningState:
             assignment_desc = f"{assignment.title}\n{assignment.objective}\n\nSteps:\n"
             assignment_desc += "\n".join([f"{s.step_number}. {s.instruction}" for s in assignment.steps])
             
-            print(f"\n{'='*70}")
-            print(f"DEBUG: Parsing assignment submission from message")
-            print(f"Raw message: {raw_message[:200]}...")
-            print(f"{'='*70}\n")
+            logger.debug(
+                "\n%s\nParsing assignment submission from message\nRaw message: %.200s...\n%s",
+                DEBUG_DIVIDER, raw_message, DEBUG_DIVIDER
+            )
             
-            # Parse the submission from natural language
-            from app.agents import parse_assignment_submission
+            # Parse the submission from natural language; a bare code block is used as is
             try:
-                submission = await parse_assignment_submission(raw_message, assignment_desc)
-                print(f"Parsed submission length: {len(submission)} chars")
+                fenced = FENCED_SUBMISSION.fullmatch(raw_message)
+                submission = (
+                    fenced.group(1) if fenced
+                    else await parse_assignment_submission(raw_message, assignment_desc)
+                )
+                logger.info("Parsed submission length: %d chars", len(submission))
             except Exception as e:
-                print(f"Error parsing assignment submission: {e}")
+                logger.error("Error parsing assignment submission: %s", e)
                 submission = ""
     
     if not submission or submission.strip() == "":
-        print("⚠️ No submission provided, assigning low score")
-        no_submission_msg = "⚠️ No submission received. Please submit your assignment to continue."
+        logger.warning("⚠️ No submission provided, assigning low score")
         # Create a minimal grading result
         return {
-            **state,
-            "messages": [create_ai_message(no_submission_msg)],
+            "messages": [create_ai_message(NO_SUBMISSION_MESSAGE)],
             "assignment_score": 0,
             "weak_points": current_lesson.key_concepts,
             "waiting_for_input": False
@@ -546,35 +803,31 @@ async def grade_assignment_node(state: LearningState) -> LearningState:
         student_submission=submission
     )
     
-    print(f"✓ Graded: {grading_result.score}% ({grading_result.grade_level})")
+    logger.info("✓ Graded: %s%% (%s)", grading_result.score, grading_result.grade_level)
     
     # Format grading result for chat UI
-    grading_text = f"# ✏️ Assignment Grading Results\n\n"
-    grading_text += f"## 📊 Score: {grading_result.score}%\n"
-    grading_text += f"**Grade Level:** {grading_result.grade_level}\n\n"
+    grading_parts = ["# ✏️ Assignment Grading Results\n\n"]
+    grading_parts.append(f"## 📊 Score: {grading_result.score}%\n")
+    grading_parts.append(f"**Grade Level:** {grading_result.grade_level}\n\n")
     
     if grading_result.strengths:
-        grading_text += f"## ✅ Strengths\n\n"
-        for strength in grading_result.strengths:
-            grading_text += f"- {strength}\n"
-        grading_text += "\n"
+        grading_parts.append("## ✅ Strengths\n\n")
+        grading_parts.extend(f"- {strength}\n" for strength in grading_result.strengths)
+        grading_parts.append("\n")
     
     if grading_result.weak_points:
-        grading_text += f"## 📝 Areas for Improvement\n\n"
-        for weakness in grading_result.weak_points:
-            grading_text += f"- {weakness}\n"
-        grading_text += "\n"
+        grading_parts.append("## 📝 Areas for Improvement\n\n")
+        grading_parts.extend(f"- {weakness}\n" for weakness in grading_result.weak_points)
+        grading_parts.append("\n")
     
-    grading_text += f"## 💬 Detailed Feedback\n\n{grading_result.detailed_feedback}\n\n"
+    grading_parts.append(f"## 💬 Detailed Feedback\n\n{grading_result.detailed_feedback}\n\n")
     
     if grading_result.recommendations:
-        grading_text += f"## 💡 Recommendations\n\n"
-        for recommendation in grading_result.recommendations:
-            grading_text += f"- {recommendation}\n"
+        grading_parts.append("## 💡 Recommendations\n\n")
+        grading_parts.extend(f"- {recommendation}\n" for recommendation in grading_result.recommendations)
     
     return {
-        **state,
-        "messages": [create_ai_message(grading_text)],
+        "messages": [create_ai_message("".join(grading_parts))],
         "grading_result": grading_result,
         "assignment_score": int(grading_result.score),
         "weak_points": grading_result.weak_points,
@@ -582,31 +835,53 @@ async def grade_assignment_node(state: LearningState) -> LearningState:
     }
 
 
-async def should_advance(state: LearningState) -> Literal["advance", "repeat", "end"]:
-    """Determine if student should advance or repeat the lesson"""
-    
-    # Check if course is complete
-    if state.get('completed', False):
-        return "end"
-    
+async def evaluate_progress_node(state: LearningState) -> LearningState:
+    """Decide whether to advance or repeat, along with the matching follow-up message"""
     learning_plan = state['learning_plan']
     if not learning_plan:
         raise ValueError("Learning plan not initialized")
         
-    current_lesson = learning_plan.lessons[state['current_lesson_idx']]
+    current_idx = state['current_lesson_idx']
+    current_lesson = learning_plan.lessons[current_idx]
+    
+    next_idx = current_idx + 1
+    if next_idx >= len(learning_plan.lessons):
+        next_lesson_title = "Course Completion"
+    else:
+        next_lesson_title = learning_plan.lessons[next_idx].title
     
-    print(f"\n🤔 Evaluating progress for: {current_lesson.title}")
+    logger.info("🤔 Evaluating progress for: %s", current_lesson.title)
     
-    decision = await check_progress_agent(
+    decision, repeat_msg, advance_msg = await evaluate_progress(
         lesson_title=current_lesson.title,
         quiz_score=state['quiz_score'],
-        assignment_score=state.get('assignment_score',0),
+        assignment_score=state.get('assignment_score', 0),
         weak_points=state['weak_points'],
-        attempt_count=state['attempt_count']
+        attempt_count=state['attempt_count'],
+        next_lesson=next_lesson_title,
+        key_takeaways=current_lesson.key_concepts[:3]
     )
     
-    print(f"✓ Decision: {decision.decision.value.upper()} (Confidence: {decision.confidence.value})")
-    print(f"  Reason: {decision.reasoning[:100]}...")
+    logger.info("✓ Decision: %s (Confidence: %s)", decision.decision.value.upper(), decision.confidence.value)
+    logger.info("  Reason: %.100s...", decision.reasoning)
+    
+    return {
+        "progress_decision": decision,
+        "repeat_message": repeat_msg,
+        "advance_message": advance_msg
+    }
+
+
+def should_advance(state: LearningState) -> Literal["advance", "repeat", "end"]:
+    """Determine if student should advance or repeat the lesson"""
+    
+    # Check if course is complete
+    if state.get('completed', False):
+        return "end"
+    
+    decision = state.get('progress_decision')
+    if not decision:
+        raise ValueError("Progress decision not available")
     
     return decision.decision.value
 
@@ -627,32 +902,27 @@ async def advance_lesson(state: LearningState) -> LearningState:
     else:
         next_lesson_title = learning_plan.lessons[next_idx].title
     
-    print(f"\n🎉 Advancing from: {current_lesson.title}")
+    logger.info("🎉 Advancing from: %s", current_lesson.title)
     
-    advance_msg = await create_advance_message(
-        completed_lesson=current_lesson.title,
-        next_lesson=next_lesson_title,
-        key_takeaways=current_lesson.key_concepts[:3]  # Top 3 concepts
-    )
+    # Drafted by evaluate_progress_node alongside the decision
+    advance_msg = state['advance_message']
     
-    print(f"✓ {advance_msg.message[:100]}...")
+    logger.info("✓ %.100s...", advance_msg.message)
     
     # Format advancement message for chat UI
-    advance_text = f"# 🎉 Lesson Complete!\n\n"
-    advance_text += f"Congratulations on completing **{current_lesson.title}**!\n\n"
-    advance_text += f"## 🔑 Key Takeaways\n\n"
-    for takeaway in current_lesson.key_concepts[:3]:
-        advance_text += f"- {takeaway}\n"
-    advance_text += f"\n{advance_msg.message}\n\n"
+    advance_parts = ["# 🎉 Lesson Complete!\n\n"]
+    advance_parts.append(f"Congratulations on completing **{current_lesson.title}**!\n\n")
+    advance_parts.append("## 🔑 Key Takeaways\n\n")
+    advance_parts.extend(f"- {takeaway}\n" for takeaway in current_lesson.key_concepts[:3])
+    advance_parts.append(f"\n{advance_msg.message}\n\n")
     
     if next_idx < len(learning_plan.lessons):
-        advance_text += f"**Next up:** {next_lesson_title} 🚀"
+        advance_parts.append(f"**Next up:** {next_lesson_title} 🚀")
     else:
-        advance_text += "You're ready for the final steps! 🎓"
+        advance_parts.append("You're ready for the final steps! 🎓")
     
     return {
-        **state,
-        "messages": [create_ai_message(advance_text)],
+        "messages": [*drop_old_messages(state.get("messages", [])), create_ai_message("".join(advance_parts))],
         "current_lesson_idx": next_idx,
         "attempt_count": 0,
         "weak_points": [],
@@ -663,6 +933,9 @@ async def advance_lesson(state: LearningState) -> LearningState:
         "assignment": None,
         "assignment_submission": "",
         "grading_result": None,
+        "progress_decision": None,
+        "repeat_message": None,
+        "advance_message": None,
         "waiting_for_input": False
     }
 
@@ -675,28 +948,23 @@ async def repeat_lesson(state: LearningState) -> LearningState:
         
     current_lesson = learning_plan.lessons[state['current_lesson_idx']]
     
-    print(f"\n🔄 Repeating lesson: {current_lesson.title}")
+    logger.info("🔄 Repeating lesson: %s", current_lesson.title)
     
-    repeat_msg = await create_repeat_message(
-        lesson_title=current_lesson.title,
-        weak_points=state['weak_points'],
-        attempt_count=state['attempt_count'] + 1
-    )
+    # Drafted by evaluate_progress_node alongside the decision
+    repeat_msg = state['repeat_message']
     
-    print(f"✓ {repeat_msg.message[:100]}...")
-    print(f"  Focus areas: {', '.join(repeat_msg.focus_areas)}")
+    logger.info("✓ %.100s...", repeat_msg.message)
+    logger.info("  Focus areas: %s", ', '.join(repeat_msg.focus_areas))
     
     # Format repeat message for chat UI
-    repeat_text = f"# 🔄 Let's Review: {current_lesson.title}\n\n"
-    repeat_text += f"{repeat_msg.message}\n\n"
-    repeat_text += f"## 🎯 Focus Areas\n\n"
-    for area in repeat_msg.focus_areas:
-        repeat_text += f"- {area}\n"
-    repeat_text += "\nLet's try this again with these areas in mind! 💪"
+    repeat_parts = [f"# 🔄 Let's Review: {current_lesson.title}\n\n"]
+    repeat_parts.append(f"{repeat_msg.message}\n\n")
+    repeat_parts.append("## 🎯 Focus Areas\n\n")
+    repeat_parts.extend(f"- {area}\n" for area in repeat_msg.focus_areas)
+    repeat_parts.append("\nLet's try this again with these areas in mind! 💪")
     
     return {
-        **state,
-        "messages": [create_ai_message(repeat_text)],
+        "messages": [*drop_old_messages(state.get("messages", [])), create_ai_message("".join(repeat_parts))],
         "attempt_count": state['attempt_count'] + 1,
         "message": repeat_msg.message,
         "lecture_content": None,
@@ -705,46 +973,48 @@ async def repeat_lesson(state: LearningState) -> LearningState:
         "assignment": None,
         "assignment_submission": "",
         "grading_result": None,
+        "progress_decision": None,
+        "repeat_message": None,
+        "advance_message": None,
         "waiting_for_input": False
     }
 
 
 def route_after_extraction(state: LearningState) -> Literal["generate_plan", "request_new_query"]:
     """Route based on whether extraction was successful"""
-    # Check if topic and background are properly extracted
-    topic = state.get("topic", "").strip()
-    background = state.get("background", "").strip()
-    
-    # Check if extraction failed (as specified in the prompt)
-    failed_values = ["failed to detect", "failed"]
-    
-    topic_failed = not topic or any(fail in topic.lower() for fail in failed_values)
-    background_failed = not background or any(fail in background.lower() for fail in failed_values)
-    
-    # If extraction successful (both topic and background are valid), proceed
-    if not topic_failed and not background_failed:
-        return "generate_plan"
-    
-    # Otherwise, request new query from user
-    return "request_new_query"
+    if extraction_failed(state.get("topic"), state.get("background")):
+        # Request new query from user
+        return "request_new_query"
+    return "generate_plan"
 
 
-def create_graph(checkpointer=None):
+# Checkpoint once when a run exits (at an interrupt or END) rather than after every
+# node; runs pause for input after the quiz and the assignment, which is where they resume.
+# Passed to the graph's invoke/stream calls as durability=CHECKPOINT_DURABILITY
+CHECKPOINT_DURABILITY = os.getenv("CHECKPOINT_DURABILITY", "exit")
+
+
+# LangGraph's per-step state traces; noisy and slow, so only with PROFESSOR_DEBUG=1
+GRAPH_DEBUG = os.getenv("PROFESSOR_DEBUG") == "1"
+
+
+def thread_config(thread_id: str) -> RunnableConfig:
+    """Run config for a conversation thread"""
+    return {"configurable": {"thread_id": thread_id}}
+
+
+@lru_cache(maxsize=1)
+def build_graph() -> StateGraph:
     """
-    Create and compile the professor agent graph
+    Build the professor agent graph topology
     
-    Args:
-        checkpointer: Optional checkpointer for persisting state. 
-                     If None, uses InMemorySaver (no persistence)
+    The nodes and edges never change, so the builder is created once and
+    shared by every create_graph call; only compilation is per checkpointer.
     """
-    if checkpointer is None:
-        checkpointer = InMemorySaver()
-    
     graph = StateGraph(LearningState)
     
     # Add all nodes
     graph.add_node("extract", extract_topic_and_background_node)
-    graph.add_node("check_extraction", check_extraction_result)
     graph.add_node("request_new_query", request_new_query)
     graph.add_node("generate_plan", generate_learning_plan)
     graph.add_node("check_progress", check_progress_node)
@@ -753,16 +1023,16 @@ def create_graph(checkpointer=None):
     graph.add_node("process_quiz", process_quiz_answers)
     graph.add_node("assignment", create_assignment_node)
     graph.add_node("grade", grade_assignment_node)
+    graph.add_node("evaluate", evaluate_progress_node)
     graph.add_node("advance", advance_lesson)
     graph.add_node("repeat", repeat_lesson)
     
     # Set entry point to extraction
     graph.set_entry_point("extract")
     
-    # Check extraction and route accordingly
-    graph.add_edge("extract", "check_extraction")
+    # Route on the extraction result
     graph.add_conditional_edges(
-        "check_extraction",
+        "extract",
         route_after_extraction,
         {
             "generate_plan": "generate_plan",
@@ -780,10 +1050,11 @@ def create_graph(checkpointer=None):
     graph.add_edge("quiz", "process_quiz")  # Process answers before assignment
     graph.add_edge("process_quiz", "assignment")
     graph.add_edge("assignment", "grade")
+    graph.add_edge("grade", "evaluate")
     
     # Add conditional routing based on progress
     graph.add_conditional_edges(
-        "grade",
+        "evaluate",
         should_advance,
         {
             "advance": "advance",
@@ -796,12 +1067,26 @@ def create_graph(checkpointer=None):
     graph.add_edge("advance", "check_progress")
     graph.add_edge("repeat", "lecture")
     
+    return graph
+
+
+def create_graph(checkpointer=None):
+    """
+    Create and compile the professor agent graph
+    
+    Args:
+        checkpointer: Optional checkpointer for persisting state. 
+                     If None, uses InMemorySaver (no persistence) with checkpoint_serde()
+    """
+    if checkpointer is None:
+        checkpointer = InMemorySaver(serde=checkpoint_serde())
+    
     # Compile with checkpointer and interrupt before nodes that need input
-    app = graph.compile(
+    app = build_graph().compile(
         checkpointer=checkpointer,
         interrupt_before=["request_new_query"],
         interrupt_after=["quiz", "assignment"],
-        debug=True  
+        debug=GRAPH_DEBUG
     )
     
     return app
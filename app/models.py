@@ -1,5 +1,9 @@
-from pydantic import BaseModel, Field
-from typing import Literal, Optional
+import sys
+from copy import deepcopy
+from functools import cached_property, lru_cache
+from pydantic import AfterValidator, BaseModel, ConfigDict, Discriminator, Field, Tag
+from pydantic.json_schema import GenerateJsonSchema
+from typing import Annotated, Any, Literal, Optional
 from enum import Enum
 
 
@@ -26,26 +30,70 @@ class Confidence(str, Enum):
     MEDIUM = "Medium"
     LOW = "Low"
 
+class _AnyOfJsonSchema(GenerateJsonSchema):
+    """Describe tagged unions with anyOf, which every provider's tool schema accepts, rather than oneOf"""
+
+    def tagged_union_schema(self, schema):
+        json_schema = super().tagged_union_schema(schema)
+        json_schema["anyOf"] = json_schema.pop("oneOf")
+        return json_schema
+
+
+@lru_cache(maxsize=None)
+def _json_schema(model: type[BaseModel], *args, **kwargs) -> dict[str, Any]:
+    return BaseModel.model_json_schema.__func__(model, *args, **kwargs)
+
+
+class StructuredOutput(BaseModel):
+    """
+    Base for models the agents return as structured output, and the models nested in them
+
+    Instances are frozen: llm_cache hands the same result to every caller with
+    matching inputs, so nothing may edit one in place (use model_copy(update=...)).
+
+    LangChain converts the response schema to a tool definition on every model
+    call, and Pydantic rebuilds the JSON schema each time it's asked for one.
+    Build it once per class and hand out copies, since callers may mutate it.
+    """
+    model_config = ConfigDict(frozen=True)
+
+    @classmethod
+    def model_json_schema(cls, *args, **kwargs) -> dict[str, Any]:
+        if len(args) < 3:
+            kwargs.setdefault("schema_generator", _AnyOfJsonSchema)
+        return deepcopy(_json_schema(cls, *args, **kwargs))
+
+
+# Lesson and assignment titles are repeated across the plan, lecture, quiz, assignment
+# and grading result; interned, every copy restored from a checkpoint shares one string
+InternedStr = Annotated[str, AfterValidator(sys.intern)]
+
+
 class MessageRequest(BaseModel):
     query: str
 
-class LearningInput(BaseModel):
+class LearningInput(StructuredOutput):
     topic: str
     background: str
     
 # Models for Learning Plan
-class Lesson(BaseModel):
+class Lesson(StructuredOutput):
     """Individual lesson in a learning plan"""
     lesson_number: int = Field(..., description="Sequential lesson number")
-    title: str = Field(..., description="Descriptive lesson title")
-    objectives: list[str] = Field(..., min_length=3, max_length=5, description="3-5 specific learning objectives")
-    key_concepts: list[str] = Field(..., description="Main concepts covered in this lesson")
+    title: InternedStr = Field(..., description="Descriptive lesson title")
+    objectives: tuple[str, ...] = Field(..., min_length=3, max_length=5, description="3-5 specific learning objectives")
+    key_concepts: tuple[str, ...] = Field(..., description="Main concepts covered in this lesson")
     duration_minutes: int = Field(..., ge=15, le=120, description="Estimated lesson duration in minutes")
-    prerequisites: list[str] = Field(default_factory=list, description="Required knowledge from previous lessons")
+    prerequisites: tuple[str, ...] = Field(default_factory=tuple, description="Required knowledge from previous lessons")
     difficulty: DifficultyLevel = Field(..., description="Difficulty level of the lesson")
 
+    @cached_property
+    def objectives_markdown(self) -> str:
+        """Objectives as a Markdown bullet list, shared by the plan overview and lesson intro"""
+        return "".join(f"- {obj}\n" for obj in self.objectives)
+
 
-class LearningPlan(BaseModel):
+class LearningPlan(StructuredOutput):
     """Complete learning plan for a topic"""
     topic: str = Field(..., description="The main topic being taught")
     lessons: list[Lesson] = Field(..., min_length=5, max_length=8, description="5-8 progressive lessons")
@@ -54,59 +102,88 @@ class LearningPlan(BaseModel):
 
 
 # Models for Lecture
-class LectureSegment(BaseModel):
+class LectureSegment(StructuredOutput):
     """A segment of the lecture content"""
     segment_number: int = Field(..., description="Order of this segment")
-    title: str = Field(..., description="Segment title")
+    title: InternedStr = Field(..., description="Segment title")
     content: str = Field(..., description="The actual lecture content for this segment")
     duration_minutes: int = Field(..., ge=3, le=8, description="Duration of this segment")
-    interaction_points: list[str] = Field(default_factory=list, description="Questions or reflection points")
+    interaction_points: tuple[str, ...] = Field(default_factory=tuple, description="Questions or reflection points")
 
 
-class Lecture(BaseModel):
+class Lecture(StructuredOutput):
     """Complete lecture content"""
-    lesson_title: str = Field(..., description="Title of the lesson")
+    lesson_title: InternedStr = Field(..., description="Title of the lesson")
     introduction: str = Field(..., description="2-3 minute introduction with overview and objectives")
     segments: list[LectureSegment] = Field(..., min_length=2, max_length=3, description="2-3 main content segments")
     conclusion: str = Field(..., description="2-3 minute conclusion with summary and next steps")
     total_duration_minutes: int = Field(..., ge=15, le=20, description="Total lecture duration")
-    key_takeaways: list[str] = Field(..., description="Main points students should remember")
+    key_takeaways: tuple[str, ...] = Field(..., description="Main points students should remember")
+
+    @cached_property
+    def summary(self) -> str:
+        """Introduction plus the opening of each segment, used to ground quiz questions"""
+        return f"{self.introduction}\n" + "\n".join(
+            f"{seg.title}: {seg.content[:200]}..." for seg in self.segments
+        )
 
 
 # Models for Quiz
-class MultipleChoiceQuestion(BaseModel):
+class MultipleChoiceQuestion(StructuredOutput):
     """Multiple choice question"""
     question: str = Field(..., description="The question text")
     type: Literal[QuestionType.MULTIPLE_CHOICE] = QuestionType.MULTIPLE_CHOICE
-    options: list[str] = Field(..., min_length=4, max_length=4, description="Exactly 4 answer options (A, B, C, D)")
+    options: tuple[str, ...] = Field(..., min_length=4, max_length=4, description="Exactly 4 answer options (A, B, C, D)")
     correct_answer: str = Field(..., description="The correct option (e.g., 'A', 'B', 'C', or 'D')")
     explanation: str = Field(..., description="Explanation of why the answer is correct")
-    misconceptions: list[str] = Field(default_factory=list, description="Common wrong assumptions")
+    misconceptions: tuple[str, ...] = Field(default_factory=tuple, description="Common wrong assumptions")
 
 
-class TrueFalseQuestion(BaseModel):
+class TrueFalseQuestion(StructuredOutput):
     """True/False question with explanation requirement"""
     question: str = Field(..., description="The question text")
     type: Literal[QuestionType.TRUE_FALSE] = QuestionType.TRUE_FALSE
     correct_answer: bool = Field(..., description="True or False")
     explanation: str = Field(..., description="Detailed explanation of the correct answer")
-    misconceptions: list[str] = Field(default_factory=list, description="Common wrong assumptions")
+    misconceptions: tuple[str, ...] = Field(default_factory=tuple, description="Common wrong assumptions")
 
 
-class ShortAnswerQuestion(BaseModel):
+class ShortAnswerQuestion(StructuredOutput):
     """Short answer or application question"""
     question: str = Field(..., description="The question text")
     type: Literal[QuestionType.SHORT_ANSWER] = QuestionType.SHORT_ANSWER
     correct_answer: str = Field(..., description="Sample correct answer")
-    key_points: list[str] = Field(..., description="Key points that should be in a correct answer")
+    key_points: tuple[str, ...] = Field(..., description="Key points that should be in a correct answer")
     explanation: str = Field(..., description="Explanation of what makes a good answer")
-    misconceptions: list[str] = Field(default_factory=list, description="Common wrong assumptions")
+    misconceptions: tuple[str, ...] = Field(default_factory=tuple, description="Common wrong assumptions")
+
+
+def _question_type(question: Any) -> str:
+    """Tag a question by its type, or by its shape when the model left the default type out"""
+    if isinstance(question, dict):
+        if "type" in question:
+            return getattr(question["type"], "value", question["type"])
+        if "options" in question:
+            return QuestionType.MULTIPLE_CHOICE.value
+        if "key_points" in question:
+            return QuestionType.SHORT_ANSWER.value
+        return QuestionType.TRUE_FALSE.value
+    return question.type.value
+
 
+# Validates each question against the one model its type names instead of trying all three
+Question = Annotated[
+    Annotated[MultipleChoiceQuestion, Tag(QuestionType.MULTIPLE_CHOICE.value)]
+    | Annotated[TrueFalseQuestion, Tag(QuestionType.TRUE_FALSE.value)]
+    | Annotated[ShortAnswerQuestion, Tag(QuestionType.SHORT_ANSWER.value)],
+    Discriminator(_question_type)
+]
 
-class Quiz(BaseModel):
+
+class Quiz(StructuredOutput):
     """Complete quiz with 5 questions"""
-    lesson_title: str = Field(..., description="The lesson this quiz assesses")
-    questions: list[MultipleChoiceQuestion | TrueFalseQuestion | ShortAnswerQuestion] = Field(
+    lesson_title: InternedStr = Field(..., description="The lesson this quiz assesses")
+    questions: list[Question] = Field(
         ..., 
         min_length=5, 
         max_length=5, 
@@ -117,7 +194,7 @@ class Quiz(BaseModel):
 
 class QuizResults(BaseModel):
     """Results from a student's quiz attempt"""
-    quiz_title: str = Field(..., description="Title of the quiz taken")
+    quiz_title: InternedStr = Field(..., description="Title of the quiz taken")
     total_questions: int = Field(..., description="Total number of questions")
     correct_answers: int = Field(..., description="Number of correct answers")
     score_percentage: float = Field(..., ge=0, le=100, description="Score as a percentage")
@@ -127,38 +204,38 @@ class QuizResults(BaseModel):
 
 
 # Models for Assignment
-class AssignmentStep(BaseModel):
+class AssignmentStep(StructuredOutput):
     """Individual step in an assignment"""
     step_number: int = Field(..., description="Sequential step number")
     instruction: str = Field(..., description="What the student needs to do")
     expected_outcome: str = Field(..., description="What should result from this step")
-    hints: list[str] = Field(default_factory=list, description="Optional hints to help")
+    hints: tuple[str, ...] = Field(default_factory=tuple, description="Optional hints to help")
 
 
-class Assignment(BaseModel):
+class Assignment(StructuredOutput):
     """Complete assignment"""
-    title: str = Field(..., description="Assignment title")
-    lesson_title: str = Field(..., description="Related lesson")
+    title: InternedStr = Field(..., description="Assignment title")
+    lesson_title: InternedStr = Field(..., description="Related lesson")
     objective: str = Field(..., description="What the assignment aims to achieve")
     background: str = Field(..., description="Context or scenario for the assignment")
     steps: list[AssignmentStep] = Field(..., min_length=5, max_length=8, description="5-8 step-by-step instructions")
-    deliverables: list[str] = Field(..., description="What the student should submit")
-    success_criteria: list[str] = Field(..., description="How the assignment will be evaluated")
+    deliverables: tuple[str, ...] = Field(..., description="What the student should submit")
+    success_criteria: tuple[str, ...] = Field(..., description="How the assignment will be evaluated")
     estimated_duration_minutes: int = Field(..., ge=30, le=60, description="Expected time to complete")
-    resources: list[str] = Field(default_factory=list, description="Helpful resources or references")
-    bonus_challenges: list[str] = Field(default_factory=list, description="Optional extra credit tasks")
+    resources: tuple[str, ...] = Field(default_factory=tuple, description="Helpful resources or references")
+    bonus_challenges: tuple[str, ...] = Field(default_factory=tuple, description="Optional extra credit tasks")
 
 
 # Models for Grading
-class GradingResult(BaseModel):
+class GradingResult(StructuredOutput):
     """Results from grading an assignment"""
-    assignment_title: str = Field(..., description="Title of the graded assignment")
+    assignment_title: InternedStr = Field(..., description="Title of the graded assignment")
     score: float = Field(..., ge=0, le=100, description="Score out of 100")
     passed: bool = Field(..., description="Whether the student passed (score >= 70)")
-    strengths: list[str] = Field(..., min_length=2, max_length=3, description="2-3 things done well")
-    improvements: list[str] = Field(..., min_length=2, max_length=3, description="2-3 areas needing work")
-    recommendations: list[str] = Field(..., description="Concrete steps for improvement")
-    weak_points: list[str] = Field(default_factory=list, description="Concepts needing reinforcement")
+    strengths: tuple[str, ...] = Field(..., min_length=2, max_length=3, description="2-3 things done well")
+    improvements: tuple[str, ...] = Field(..., min_length=2, max_length=3, description="2-3 areas needing work")
+    recommendations: tuple[str, ...] = Field(..., description="Concrete steps for improvement")
+    weak_points: tuple[str, ...] = Field(default_factory=tuple, description="Concepts needing reinforcement")
     detailed_feedback: str = Field(..., description="Overall narrative feedback")
     grade_level: Literal["Exceeds", "Meets", "Partially Meets", "Does Not Meet"] = Field(
         ..., 
@@ -166,49 +243,57 @@ class GradingResult(BaseModel):
     )
 
 
-# Models for Progress Decision
-class ProgressDecision(BaseModel):
-    """Decision on whether to advance or repeat"""
-    decision: Decision = Field(..., description="Whether to advance or repeat the lesson")
-    reasoning: str = Field(..., description="Detailed explanation of the decision")
-    focus_areas: list[str] = Field(default_factory=list, description="Areas to focus on (especially if repeating)")
-    confidence: Confidence = Field(..., description="Confidence level in this decision")
-    current_lesson: int = Field(..., description="Current lesson number")
-    total_lessons: int = Field(..., description="Total lessons in the plan")
-    quiz_score: float = Field(..., ge=0, le=100, description="Quiz score percentage")
-    assignment_score: float = Field(..., ge=0, le=100, description="Assignment score percentage")
-    attempt_count: int = Field(..., ge=1, le=3, description="Number of attempts at this lesson")
-
-
 # Models for Student Messages
-class RepeatMessage(BaseModel):
+class RepeatMessage(StructuredOutput):
     """Encouraging message for repeating a lesson"""
     message: str = Field(..., description="Main encouraging message")
     acknowledgment: str = Field(..., description="Positive acknowledgment of effort")
     explanation: str = Field(..., description="Why repetition helps learning")
-    focus_areas: list[str] = Field(..., min_length=2, max_length=3, description="2-3 specific areas to focus on")
-    study_tips: list[str] = Field(..., description="Strategies for improvement")
+    focus_areas: tuple[str, ...] = Field(..., min_length=2, max_length=3, description="2-3 specific areas to focus on")
+    study_tips: tuple[str, ...] = Field(..., description="Strategies for improvement")
     expectations: str = Field(..., description="What to expect in the repeated lesson")
 
 
-class AdvanceMessage(BaseModel):
+class AdvanceMessage(StructuredOutput):
     """Congratulatory message for advancing"""
     message: str = Field(..., description="Main congratulatory message")
     celebration: str = Field(..., description="Specific celebration of success")
-    key_achievements: list[str] = Field(..., description="Summary of what was mastered")
+    key_achievements: tuple[str, ...] = Field(..., description="Summary of what was mastered")
     next_lesson_preview: str = Field(..., description="What's coming next")
     motivation: str = Field(..., description="Encouragement for continued learning")
     progress_summary: str = Field(..., description="Overall progress through the course")
 
 
-class ShortAnswerEvaluation(BaseModel):
+# Models for Progress Decision
+class ProgressDecision(StructuredOutput):
+    """Decision on whether to advance or repeat"""
+    decision: Decision = Field(..., description="Whether to advance or repeat the lesson")
+    reasoning: str = Field(..., description="Detailed explanation of the decision")
+    focus_areas: tuple[str, ...] = Field(default_factory=tuple, description="Areas to focus on (especially if repeating)")
+    confidence: Confidence = Field(..., description="Confidence level in this decision")
+    current_lesson: int = Field(..., description="Current lesson number")
+    total_lessons: int = Field(..., description="Total lessons in the plan")
+    quiz_score: float = Field(..., ge=0, le=100, description="Quiz score percentage")
+    assignment_score: float = Field(..., ge=0, le=100, description="Assignment score percentage")
+    attempt_count: int = Field(..., ge=1, le=3, description="Number of attempts at this lesson")
+    repeat_message: Optional[RepeatMessage] = Field(None, description="Encouraging message for the student, only when the decision is repeat")
+    advance_message: Optional[AdvanceMessage] = Field(None, description="Congratulatory message for the student, only when the decision is advance")
+
+
+class ShortAnswerEvaluation(StructuredOutput):
     """Evaluation result for a short answer question"""
     is_correct: bool = Field(..., description="Whether the answer demonstrates sufficient understanding")
     reasoning: str = Field(..., description="Brief explanation of the evaluation")
+    confidence: Confidence = Field(..., description="Confidence level in this evaluation")
+
+
+class ShortAnswerEvaluationBatch(StructuredOutput):
+    """Evaluation results for several short answer questions graded together"""
+    evaluations: list[ShortAnswerEvaluation] = Field(..., description="One evaluation per answer, in the same order as the questions")
 
 
 # Models for parsing user input
-class QuizAnswersParsed(BaseModel):
+class QuizAnswersParsed(StructuredOutput):
     """Parsed quiz answers from user message"""
     q0: str = Field(..., description="Answer to question 1 (e.g., 'A', 'True', or short text)")
     q1: str = Field(..., description="Answer to question 2")
@@ -217,7 +302,7 @@ class QuizAnswersParsed(BaseModel):
     q4: str = Field(..., description="Answer to question 5")
 
 
-class AssignmentSubmissionParsed(BaseModel):
+class AssignmentSubmissionParsed(StructuredOutput):
     """Parsed assignment submission from user message"""
     submission_text: str = Field(..., description="The actual code, solution, or work submitted by the student. Extract all code blocks, file contents, or answers from the message.")
 
@@ -1,10 +1,32 @@
 # Prompts for the Professor Agent LangGraph
 # Note: Structured output is handled by agents using Pydantic models
 
-from langchain_core.prompts import PromptTemplate
+from string import Formatter
+
+
+class FastPromptTemplate:
+    """
+    Minimal stand-in for LangChain's PromptTemplate covering the format() calls the agents make
+
+    The template's fields are parsed once at import and checked against input_variables,
+    so format() is a plain str.format without LangChain's per-call validation and
+    partial-variable merging (about 2.5x faster for the lecture prompt).
+    """
+    __slots__ = ("template", "input_variables")
+
+    def __init__(self, template: str, input_variables: list[str]):
+        fields = {name for _, name, _, _ in Formatter().parse(template) if name}
+        if fields != set(input_variables):
+            raise ValueError(f"Template fields {sorted(fields)} don't match input_variables {sorted(input_variables)}")
+        self.template = template
+        self.input_variables = input_variables
+
+    def format(self, **kwargs) -> str:
+        return self.template.format(**kwargs)
+
 
 EXTRACTION_SYSTEM_PROMPT = """You are an expert communicator who specializes in extracting the intent behind what people say"""
-EXTRACTION_PROMPT = PromptTemplate(
+EXTRACTION_PROMPT = FastPromptTemplate(
     template="""
    Extract the topic the user wants to learn, along with their background from the following text: \n{query}\n If you can not detect the topic nor the user's background both must be labeled as 'failed to detect' and nothing else.
    """,
@@ -19,429 +41,193 @@ TUTOR_SYSTEM_PROMPT = """You are a helpful tutor focused on personalized learnin
 
 
 # Learning Plan Prompt
-LEARNING_PLAN_SYSTEM_PROMPT = """You are an expert educational consultant tasked with creating a comprehensive learning plan."""
-LEARNING_PLAN_PROMPT = PromptTemplate(
+LEARNING_PLAN_INSTRUCTIONS = """Create a structured learning plan:
+- 5-8 progressive lessons, each scaffolding on the previous ones with explicit prerequisites
+- 3-5 specific, measurable objectives per lesson
+- Key concepts, a realistic duration (15-120 minutes) and a difficulty level (Beginner/Intermediate/Advanced) per lesson
+- Comprehensive enough to reach mastery of the topic
+
+Use the student's background to set the starting difficulty, depth of coverage, pace, and real-world applications that will resonate."""
+
+LEARNING_PLAN_SYSTEM_PROMPT = f"""You are an expert educational consultant tasked with creating a comprehensive learning plan.
+
+{LEARNING_PLAN_INSTRUCTIONS}"""
+LEARNING_PLAN_PROMPT = FastPromptTemplate(
     template="""Topic: {topic}
 Student Background: {background}
 
-Create a structured learning plan with the following requirements:
-
-1. Break down the topic into 5-8 progressive lessons that build logically
-2. Each lesson should scaffold upon previous knowledge
-3. Include 3-5 clear, specific learning objectives per lesson
-4. Estimate realistic time requirements (15-120 minutes per lesson)
-5. Identify prerequisites and key concepts for each lesson
-6. Assign appropriate difficulty levels (Beginner/Intermediate/Advanced)
-
-Design the plan to be:
-- Pedagogically sound with proper scaffolding
-- Comprehensive enough to achieve mastery of the topic
-- Realistic in time estimates and difficulty progression
-- Clear in objectives that are measurable and actionable
-- Connected between lessons with explicit prerequisites
-
-Consider the student's background when determining:
-- Starting difficulty level
-- Depth of coverage for each concept
-- Pace of progression through material
-- Real-world applications that would resonate
-
-Ensure the plan is logical, progressive, and comprehensive for mastering the topic.""",
+Create the learning plan for this topic and student.""",
     input_variables=["topic", "background"]
 )
 
 
 # Lecture Prompt
-LECTURE_SYSTEM_PROMPT = PROFESSOR_SYSTEM_PROMPT
-LECTURE_PROMPT = PromptTemplate(
+LECTURE_INSTRUCTIONS = """Write the lecture in clean GitHub-flavored Markdown:
+- # for the lecture title, ## for sections, ### for subsections
+- Blank lines between paragraphs and around lists; no walls of text
+- Fenced code blocks with language tags for code
+- **bold** for key terms, *italic* for emphasis, > for quotes
+
+Structure:
+- Introduction (2-3 minutes): hook, overview, objectives
+- 2-3 main segments (12-15 minutes total), each building on the last, with a ## heading, thorough content, interaction points (questions, thought experiments, reflection prompts) and a duration
+- Conclusion (2-3 minutes): key takeaways and a preview of what's next
+
+Teach actively: build from simple to complex with concrete analogies, real-world examples and storytelling, connect to prior knowledge, explicitly address weak points from previous lessons, and keep the tone conversational."""
+
+LECTURE_SYSTEM_PROMPT = f"{PROFESSOR_SYSTEM_PROMPT}\n\n{LECTURE_INSTRUCTIONS}"
+LECTURE_PROMPT = FastPromptTemplate(
     template="""Current Lesson: {lesson_title}
 Learning Objectives: {objectives}
 Key Concepts: {key_concepts}
 Student's Current Knowledge: {current_knowledge}
 Weak Points from Previous Lessons: {weak_points}
 
-Create an engaging 15-20 minute lecture that achieves the learning objectives.
-
-CRITICAL FORMATTING REQUIREMENTS:
-Your lecture content MUST be formatted in clean, readable Markdown. Follow these rules strictly:
-
-1. Use proper heading hierarchy:
-   - # for the main lecture title
-   - ## for major sections (Introduction, Main Content sections, Conclusion)
-   - ### for subsections if needed
-
-2. Use blank lines to separate paragraphs and sections for readability
-
-3. Use markdown lists properly:
-   - Bulleted lists with - or *
-   - Numbered lists with 1., 2., 3.
-   - Always add blank line before and after lists
-
-4. For code examples, use proper code blocks with language tags:
-   ```python
-   # Your code here
-   ```
-
-5. Use **bold** for key terms and *italic* for emphasis
-
-6. Use > for blockquotes when appropriate
-
-7. Keep paragraphs readable - don't create walls of text without breaks
-
-Structure Requirements:
-- Introduction (2-3 minutes): Hook the student, present overview, state clear objectives
-- Main Content (12-15 minutes): Break into 2-3 coherent segments, each building on the last
-- Conclusion (2-3 minutes): Summarize key takeaways and preview what's next
-
-Teaching Techniques to Use:
-- Use concrete analogies and real-world examples to illustrate abstract concepts
-- Build concepts progressively from simple to complex
-- Include interaction points where students should pause to reflect or answer questions
-- Make connections to prior knowledge and the overall topic
-- Address any weak points from previous lessons explicitly
-- Use engaging, conversational language that makes content memorable
-
-For each segment, provide:
-- A clear ## heading indicating what will be covered
-- Rich, detailed content that teaches the concept thoroughly with proper markdown formatting
-- Interaction points (questions, thought experiments, reflection prompts)
-- Estimated duration for pacing
-
-Remember: 
-- You're not just presenting information - you're actively teaching
-- The content MUST be properly formatted with markdown for maximum readability
-- Use headings, lists, code blocks, and paragraph breaks appropriately
-- Make students think, connect ideas, and engage with the material
-- Use rhetorical questions, storytelling, and practical applications to maintain interest""",
+Create an engaging 15-20 minute lecture that achieves the learning objectives.""",
     input_variables=["lesson_title", "objectives", "key_concepts", "current_knowledge", "weak_points"]
 )
 
 
 # Quiz Prompt
-QUIZ_SYSTEM_PROMPT = PROFESSOR_SYSTEM_PROMPT
-QUIZ_PROMPT = PromptTemplate(
-    template="""You are creating a quiz to assess student understanding of the recent lecture.
-
-Lesson Topic: {lesson_title}
+QUIZ_INSTRUCTIONS = """Write quiz questions that test understanding and application rather than memorization:
+- 2-3 multiple choice (4 plausible options of similar length; wrong options reflect real misconceptions; no "all/none of the above"), 1 true/false, 1-2 short answer/application
+- Each aligned to a learning objective and answerable from the lecture, covering different objectives
+- Ordered from recall to application/analysis; realistic scenarios where possible; no ambiguous or trick wording
+- Each with the correct answer, an explanation of why it's correct, and common misconceptions
+- On a repeat attempt, write new questions rather than the most obvious ones, weighted toward the weak areas"""
+
+QUIZ_SYSTEM_PROMPT = f"{PROFESSOR_SYSTEM_PROMPT}\n\n{QUIZ_INSTRUCTIONS}"
+QUIZ_PROMPT = FastPromptTemplate(
+    template="""Lesson Topic: {lesson_title}
 Learning Objectives: {objectives}
 Key Concepts Covered: {key_concepts}
 Lecture Content Summary: {lecture_summary}
+Previous Attempts: {attempt_count}
+Student Weak Areas: {weak_points}
 
-Create exactly 5 questions that thoroughly assess comprehension of this lesson.
-
-Question Design Principles:
-- Test understanding and application, not just memorization
-- Align each question with a specific learning objective
-- Range from basic recall to higher-order thinking (application/analysis)
-- Include realistic scenarios or problems when possible
-- Avoid ambiguous wording or trick questions
-
-Question Type Distribution (total = 5 questions):
-- Multiple Choice: 2-3 questions with 4 plausible options each
-- True/False: 1 question requiring explanation of reasoning
-- Short Answer/Application: 1-2 questions testing applied understanding
-
-For Each Question Provide:
-- Clear, unambiguous question text
-- Correct answer(s)
-- Detailed explanation of why the answer is correct
-- Common misconceptions students might have
-- For multiple choice: 4 options where incorrect options represent plausible misconceptions
-
-Quality Criteria:
-- Each question should be answerable based on the lecture content
-- Options should be roughly equal in length and specificity
-- Avoid "all of the above" or "none of the above" options
-- Test different aspects of the learning objectives
-- Progress from easier to more challenging questions
-
-Ensure the quiz validates genuine understanding, not superficial memorization.""",
-    input_variables=["lesson_title", "objectives", "key_concepts", "lecture_summary"]
+Create exactly 5 questions that thoroughly assess comprehension of this lesson.""",
+    input_variables=["lesson_title", "objectives", "key_concepts", "lecture_summary", "attempt_count", "weak_points"]
 )
 
 
 # Assignment Prompt
-ASSIGNMENT_SYSTEM_PROMPT = PROFESSOR_SYSTEM_PROMPT
-ASSIGNMENT_PROMPT = PromptTemplate(
-    template="""You are designing a practical assignment to reinforce learning through application.
-
-Lesson Topic: {lesson_title}
+ASSIGNMENT_INSTRUCTIONS = """Design a hands-on assignment that takes 30-60 minutes:
+- Practical, real-world application of the concepts with clear, objectively gradable deliverables
+- Title, objective (what and why), and a background scenario that gives it meaning
+- 5-8 clear, sequential steps with hints for the harder ones; guide without giving answers away
+- Deliverables, success criteria, helpful resources, and optional bonus challenges
+- Challenging but achievable with the lesson's knowledge
+
+Target the weak areas from the quiz with tasks and extra hints that practice those concepts.
+On a repeat attempt, use a different scenario and tasks than a first attempt would get."""
+
+ASSIGNMENT_SYSTEM_PROMPT = f"{PROFESSOR_SYSTEM_PROMPT}\n\n{ASSIGNMENT_INSTRUCTIONS}"
+ASSIGNMENT_PROMPT = FastPromptTemplate(
+    template="""Lesson Topic: {lesson_title}
 Learning Objectives: {objectives}
 Key Concepts: {key_concepts}
 Quiz Performance: {quiz_results}
 Student Weak Areas: {weak_points}
+Previous Attempts: {attempt_count}
 
-Create a hands-on assignment that solidifies understanding through practice.
-
-Assignment Requirements:
-- Realistic completion time: 30-60 minutes
-- Practical application of concepts, not just theoretical repetition
-- Clear deliverables that can be objectively evaluated
-- Appropriate challenge level: difficult enough to require thought, achievable with lesson knowledge
-- Real-world relevance to maintain motivation
-
-Structure:
-- Title and Objective: What will the student accomplish and why it matters
-- Background/Scenario: Context that makes the assignment meaningful
-- Instructions: 5-8 clear, sequential steps with specific actions
-- Deliverables: Exactly what the student should submit
-- Success Criteria: How the assignment will be evaluated
-- Resources: Any helpful references, templates, or examples
-- Bonus Challenges: Optional extensions for deeper exploration
-
-Scaffolding Guidelines:
-- Break complex tasks into manageable sub-steps
-- Provide guidance without giving away answers
-- Include hints for steps that might be challenging
-- Give examples of what good work looks like
-- Anticipate common mistakes and address them proactively
-
-Personalization:
-- Pay special attention to weak areas identified in the quiz
-- Design tasks that specifically practice those concepts
-- Provide extra support or hints for challenging areas
-- Ensure the assignment helps bridge identified knowledge gaps
-
-Make it engaging, practical, and directly tied to mastering the learning objectives.""",
-    input_variables=["lesson_title", "objectives", "key_concepts", "quiz_results", "weak_points"]
+Create a hands-on assignment that solidifies understanding through practice.""",
+    input_variables=["lesson_title", "objectives", "key_concepts", "quiz_results", "weak_points", "attempt_count"]
 )
 
 
 # Grading Prompt
-GRADING_SYSTEM_PROMPT = TUTOR_SYSTEM_PROMPT
-GRADING_PROMPT = PromptTemplate(
-    template="""You are grading a student's assignment with constructive, growth-oriented feedback.
-
-Assignment Instructions: {assignment_instructions}
+GRADING_INSTRUCTIONS = """Score 0-100 against the success criteria and objectives, weighing correctness and quality without inflating:
+- 90-100 Exceeds: mastery, beyond requirements
+- 80-89 Meets: all requirements, minor gaps
+- 70-79 Partially Meets: most requirements, notable gaps
+- Below 70 Does Not Meet: incomplete, incorrect, or fundamental misunderstandings
+The student passes at 70 or above.
+
+Provide 2-3 strengths and 2-3 areas for improvement, each citing specific parts of the submission; actionable recommendations; the lesson concepts that still need practice (weak_points, used to plan future instruction); and narrative feedback connecting the score to the objectives. Be honest, specific and encouraging."""
+
+GRADING_SYSTEM_PROMPT = f"{TUTOR_SYSTEM_PROMPT}\n\n{GRADING_INSTRUCTIONS}"
+GRADING_PROMPT = FastPromptTemplate(
+    template="""Assignment Instructions: {assignment_instructions}
 Student Submission: {submission}
 Success Criteria: {success_criteria}
 Learning Objectives: {objectives}
 
-Evaluate the submission thoroughly and provide comprehensive feedback.
-
-Grading Rubric (0-100):
-- 90-100 (Exceeds): Demonstrates mastery, goes beyond requirements, shows deep understanding
-- 80-89 (Meets): Satisfies all requirements, shows solid understanding, minor gaps only
-- 70-79 (Partially Meets): Addresses most requirements, shows basic understanding, notable gaps
-- 60-69 (Approaching): Partially complete, significant conceptual gaps, needs substantial work
-- Below 60 (Does Not Meet): Incomplete or incorrect, fundamental misunderstandings, needs repetition
-
-Evaluation Components:
-
-1. SCORE (0-100): 
-   - Base score on alignment with success criteria and learning objectives
-   - Be fair but rigorous - don't inflate scores
-   - Consider both correctness and quality of work
-
-2. STRENGTHS (2-3 specific points):
-   - What the student did particularly well
-   - Use specific examples from their submission
-   - Acknowledge effort and good thinking
-
-3. AREAS FOR IMPROVEMENT (2-3 specific points):
-   - Concrete gaps, errors, or misconceptions
-   - Reference specific parts of their work
-   - Be clear but supportive in identifying issues
-
-4. RECOMMENDATIONS:
-   - Actionable steps for improvement
-   - Resources or strategies to address weaknesses
-   - Specific ways to deepen understanding
-
-5. WEAK POINTS (concepts needing reinforcement):
-   - Identify specific concepts from the lesson that aren't solid
-   - Will be used to inform future instruction
-   - Be precise about what needs more practice
-
-6. DETAILED FEEDBACK:
-   - Overall narrative assessment
-   - Connect performance to learning objectives
-   - Provide context for the score
-
-7. GRADE LEVEL:
-   - Qualitative assessment: "Exceeds", "Meets", "Partially Meets", or "Does Not Meet"
-
-Feedback Guidelines:
-- Be constructive and encouraging while being honest
-- Use specific examples from their work
-- Focus on learning and growth, not just evaluation
-- Balance criticism with recognition of effort
-- Provide clear path forward for improvement
-- Determine if student passed (score ≥ 70%)
-
-Remember: The goal is to help the student learn, not just to assign a number.""",
+Evaluate the submission thoroughly and provide comprehensive feedback.""",
     input_variables=["assignment_instructions", "submission", "success_criteria", "objectives"]
 )
 
 
 # Progress Check Prompt
-PROGRESS_CHECK_SYSTEM_PROMPT = TUTOR_SYSTEM_PROMPT
-PROGRESS_CHECK_PROMPT = PromptTemplate(
-    template="""You are assessing whether a student should advance to the next lesson or repeat the current one.
+PROGRESS_CHECK_INSTRUCTIONS = """Decide whether the student should advance or repeat:
+- Advance if quiz and assignment are both at least 70% and no critical weak points remain
+- Repeat if either score is below 70% or significant conceptual gaps remain
+- After the 3rd attempt the student may advance with a remediation plan
+Weigh whether the objectives are met, whether gaps would hinder later lessons, the performance trend and nature of the weak points, and whether repeating would help or only frustrate.
+
+Give the decision, detailed reasoning, a High/Medium/Low confidence based on how clear the data is, and focus areas (what to emphasize if repeating, or what to reinforce later if advancing with concerns).
+
+Then write the student message for your decision, speaking directly to the student in a warm, encouraging tone:
+- Advancing: fill advance_message only - celebrate specific achievements, preview the next lesson and keep momentum going
+- Repeating: fill repeat_message only - acknowledge their effort, explain why review helps, give 2-3 focus areas and practical study tips"""
 
-Current Progress:
+PROGRESS_CHECK_SYSTEM_PROMPT = f"{TUTOR_SYSTEM_PROMPT}\n\n{PROGRESS_CHECK_INSTRUCTIONS}"
+PROGRESS_CHECK_PROMPT = FastPromptTemplate(
+    template="""Current Progress:
 - Lesson: {current_lesson} of {total_lessons}
 - Quiz Score: {quiz_score}%
 - Assignment Score: {assignment_score}%
 - Attempt Count: {attempt_count}
 - Identified Weak Points: {weak_points}
 - Overall Topic: {topic}
+- Next Lesson: {next_lesson}
 
-Decision Framework:
-
-Primary Criteria:
-- ADVANCE if: Quiz score ≥70% AND assignment score ≥70% AND no critical weak points
-- REPEAT if: Either score <70% OR significant conceptual gaps remain
-- Consider: Maximum 3 attempts per lesson (after 3rd attempt, may advance with remediation plan)
-
-Holistic Evaluation:
-1. Are the learning objectives being met sufficiently?
-2. Is the student ready for more advanced concepts that build on this?
-3. Are there foundational gaps that would hinder future learning?
-4. Has the student shown growth even if scores aren't perfect?
-5. Would repetition be productive or would it create frustration?
-
-Decision Factors:
-- Performance trends: improving, plateauing, or declining?
-- Nature of weak points: minor gaps or fundamental misunderstandings?
-- Attempt count: first try or multiple attempts?
-- Overall context: early in course vs. later lessons
-- Student demonstrated effort and engagement
-
-Provide Your Recommendation:
-- Decision: "advance" or "repeat"
-- Detailed reasoning explaining the decision
-- Confidence level: High/Medium/Low (based on clarity of the data)
-- Focus areas: If repeating, what should be emphasized
-- If advancing with concerns, note what to reinforce in future lessons
-
-Balance Rigor and Support:
-- Don't advance students who aren't ready - it sets them up for failure
-- Don't keep students repeating if they've grasped essentials - it breeds frustration
-- Consider the bigger picture of the learning journey
-
-Be supportive but ensure solid understanding before advancing to prevent knowledge gaps from compounding.""",
-    input_variables=["current_lesson", "total_lessons", "quiz_score", "assignment_score", "attempt_count", "weak_points", "topic"]
+Decide whether the student should advance or repeat this lesson.""",
+    input_variables=["current_lesson", "total_lessons", "quiz_score", "assignment_score", "attempt_count", "weak_points", "topic", "next_lesson"]
 )
 
 
 # Repeat Lesson Prompt
-REPEAT_LESSON_SYSTEM_PROMPT = TUTOR_SYSTEM_PROMPT
-REPEAT_LESSON_PROMPT = PromptTemplate(
-    template="""The student needs to repeat this lesson. Create an encouraging, constructive message.
-
-Previous Performance:
+REPEAT_LESSON_INSTRUCTIONS = """The student needs to repeat this lesson. Write an honest, growth-minded message that frames repetition as a normal part of mastery:
+- Message: warm opening that acknowledges their effort
+- Acknowledgment: specific things they did well
+- Explanation: why repeated exposure builds deep learning
+- Focus areas: 2-3 specific items tied to their weak points, saying what understanding looks like
+- Study tips: concrete strategies for the weak areas and how to prepare differently
+- Expectations: what the repeat will cover, the extra support, and what success looks like next time"""
+
+REPEAT_LESSON_SYSTEM_PROMPT = f"{TUTOR_SYSTEM_PROMPT}\n\n{REPEAT_LESSON_INSTRUCTIONS}"
+REPEAT_LESSON_PROMPT = FastPromptTemplate(
+    template="""Previous Performance:
 - Quiz Score: {quiz_score}%
 - Assignment Score: {assignment_score}%
 - Attempt Number: {attempt_count}
 - Weak Points: {weak_points}
 - Learning Objectives: {objectives}
 
-Create a supportive message that maintains motivation while being honest about needs.
-
-Message Components:
-
-1. Main Message:
-   - Warm, encouraging opening
-   - Frame repetition as a positive, normal part of mastery
-   - Acknowledge the effort they've put in
-
-2. Acknowledgment:
-   - Recognize specific things they did well
-   - Validate their effort and persistence
-   - Show understanding that learning is challenging
-
-3. Explanation:
-   - Explain why repetition benefits deep learning
-   - Connect to the bigger picture of mastering the topic
-   - Emphasize that mastery requires multiple exposures for most people
-
-4. Focus Areas (2-3 specific items):
-   - Clearly identify what to concentrate on in the repeat
-   - Tie directly to their identified weak points
-   - Be specific about what understanding looks like
-
-5. Study Tips and Strategies:
-   - Concrete approaches to tackle the weak areas
-   - Different learning strategies to try (visual, written, verbal, etc.)
-   - How to prepare differently for the repeat attempt
-   - Resources or techniques that might help
-
-6. Expectations:
-   - What will be similar in the repeat lesson
-   - What additional support or focus will be provided
-   - What success looks like for the next attempt
-   - Realistic timeline and goals
-
-Tone Guidelines:
-- Encouraging and growth-minded, not punitive
-- Specific and actionable, not vague
-- Honest but supportive
-- Future-focused on improvement
-- Normalize struggle as part of learning
-
-Remember: Repetition is not failure - it's a strategic part of achieving mastery. Help the student see it this way.""",
+Create a supportive message that maintains motivation while being honest about needs.""",
     input_variables=["quiz_score", "assignment_score", "attempt_count", "weak_points", "objectives"]
 )
 
 
 # Advance Lesson Prompt
-ADVANCE_LESSON_SYSTEM_PROMPT = TUTOR_SYSTEM_PROMPT
-ADVANCE_LESSON_PROMPT = PromptTemplate(
-    template="""Congratulate the student on their achievement and prepare them for the next lesson.
-
-Current Performance:
+ADVANCE_LESSON_INSTRUCTIONS = """Congratulate the student and build momentum for the next lesson. Be specific, not generic:
+- Message: genuine congratulations on what they accomplished
+- Celebration: their performance, strong scores or especially good work
+- Key achievements: what they mastered and the transferable skills gained
+- Next lesson preview: what's next, how it builds on this lesson, and why it matters
+- Motivation: confidence for the next challenge without complacency
+- Progress summary: lessons completed out of the total and their trajectory"""
+
+ADVANCE_LESSON_SYSTEM_PROMPT = f"{TUTOR_SYSTEM_PROMPT}\n\n{ADVANCE_LESSON_INSTRUCTIONS}"
+ADVANCE_LESSON_PROMPT = FastPromptTemplate(
+    template="""Current Performance:
 - Lesson Completed: {completed_lesson}
 - Quiz Score: {quiz_score}%
 - Assignment Score: {assignment_score}%
 - Next Lesson: {next_lesson}
 - Overall Progress: {current_lesson} of {total_lessons}
 
-Create an encouraging message that celebrates success and builds momentum.
-
-Message Components:
-
-1. Main Congratulatory Message:
-   - Warm, genuine congratulations
-   - Recognize the effort and achievement
-   - Use specific language about what they accomplished
-
-2. Celebration:
-   - Specifically celebrate their performance
-   - Highlight strong scores or particularly good work
-   - Acknowledge the learning journey they've been on
-
-3. Key Achievements:
-   - Summarize what they mastered in this lesson
-   - Connect to the learning objectives
-   - Emphasize transferable skills or insights gained
-   - Note growth from where they started
-
-4. Next Lesson Preview:
-   - Brief overview of what's coming next
-   - How it builds on what they just learned
-   - Why it's exciting or important
-   - What new capabilities they'll gain
-
-5. Motivation:
-   - Encourage continued engagement and effort
-   - Build confidence for the next challenge
-   - Remind them of progress through the overall course
-   - Energize them for continued learning
-
-6. Progress Summary:
-   - Put their achievement in context (X of Y lessons complete)
-   - Show momentum and trajectory
-   - Celebrate the journey while looking forward
-
-Tone Guidelines:
-- Positive and celebratory, not generic
-- Specific about their achievements
-- Forward-looking and energizing
-- Builds confidence without creating complacency
-- Maintains enthusiasm for continued learning
-
-Remember: This is a moment to celebrate real achievement and build momentum for continued success.""",
+Create an encouraging message that celebrates success and builds momentum.""",
     input_variables=["completed_lesson", "quiz_score", "assignment_score", "next_lesson", "current_lesson", "total_lessons"]
 )
 
@@ -449,9 +235,17 @@ Remember: This is a moment to celebrate real achievement and build momentum for
 # Short Answer Evaluation Prompt
 SHORT_ANSWER_EVALUATION_SYSTEM_PROMPT = """You are an expert educational evaluator tasked with grading short answer quiz questions. 
 You must be fair but rigorous - the answer must demonstrate actual understanding of the concept, not just vague statements.
-You should look for key concepts, accurate information, and sufficient detail to show comprehension."""
+You should look for key concepts, accurate information, and sufficient detail to show comprehension.
 
-SHORT_ANSWER_EVALUATION_PROMPT = PromptTemplate(
+Criteria for a correct answer:
+1. Contains at least one of the key points or concepts
+2. Shows accurate understanding (no major misconceptions)
+3. Provides enough detail to demonstrate comprehension
+4. Is relevant to the question asked
+
+Be fair but maintain academic standards - partial understanding or vague answers should be marked incorrect."""
+
+SHORT_ANSWER_EVALUATION_PROMPT = FastPromptTemplate(
     template="""Question: {question}
 
 Expected Key Points: {key_points}
@@ -459,22 +253,20 @@ Expected Key Points: {key_points}
 Student's Answer: {student_answer}
 
 Evaluate whether the student's answer demonstrates sufficient understanding of the concept.
+Use "Low" confidence when the answer is ambiguous or borderline and you are unsure of the verdict.""",
+    input_variables=["question", "key_points", "student_answer"]
+)
 
-Criteria for a correct answer:
-1. Contains at least one of the key points or concepts
-2. Shows accurate understanding (no major misconceptions)
-3. Provides enough detail to demonstrate comprehension
-4. Is relevant to the question asked
+SHORT_ANSWER_BATCH_EVALUATION_PROMPT = FastPromptTemplate(
+    template="""Evaluate each of the following short answers independently.
 
-Return your evaluation as a JSON object with this exact structure:
-{{
-    "is_correct": true or false,
-    "reasoning": "Brief explanation of why the answer is correct or incorrect"
-}}
+{items}
 
+For each answer, decide whether it demonstrates sufficient understanding of the concept.
 
-Be fair but maintain academic standards - partial understanding or vague answers should be marked incorrect.""",
-    input_variables=["question", "key_points", "student_answer"]
+Return exactly {count} evaluations, one per answer and in the same order as listed above.
+Use "Low" confidence when an answer is ambiguous or borderline and you are unsure of the verdict.""",
+    input_variables=["items", "count"]
 )
 
 
@@ -484,23 +276,23 @@ Your job is to extract exactly 5 answers (q0 through q4) from the student's mess
 - For multiple choice: extract the letter (A, B, C, or D)
 - For true/false: extract "True" or "False"
 - For short answer: extract the full text of their answer
-Be very careful to map answers to the correct question numbers."""
+Be very careful to map answers to the correct question numbers.
+
+When mapping answers to q0, q1, q2, q3, and q4:
+- If the student numbered their answers (1, 2, 3...), remember that q0 = question 1, q1 = question 2, etc.
+- For multiple choice questions, extract just the letter (A, B, C, or D)
+- For true/false questions, extract "True" or "False"
+- For short answer questions, extract their full answer text
+- If an answer is missing or unclear, use "No answer provided" as its text"""
 
-QUIZ_ANSWER_PARSER_PROMPT = PromptTemplate(
+QUIZ_ANSWER_PARSER_PROMPT = FastPromptTemplate(
     template="""Student's message with quiz answers:
 {message}
 
 Quiz questions for reference:
 {quiz_questions}
 
-Extract the 5 answers from the message and map them to q0, q1, q2, q3, and q4.
-- If the student numbered their answers (1, 2, 3...), remember that q0 = question 1, q1 = question 2, etc.
-- For multiple choice questions, extract just the letter (A, B, C, or D)
-- For true/false questions, extract "True" or "False"
-- For short answer questions, extract their full answer text
-- If an answer is missing or unclear, use "No answer provided"
-
-Return the answers in the structured format with fields q0, q1, q2, q3, q4.""",
+Extract the 5 answers from the message and map them to q0, q1, q2, q3, and q4.""",
     input_variables=["message", "quiz_questions"]
 )
 
@@ -508,23 +300,25 @@ Return the answers in the structured format with fields q0, q1, q2, q3, q4.""",
 # Assignment Submission Parsing Prompt
 ASSIGNMENT_SUBMISSION_PARSER_SYSTEM_PROMPT = """You are an expert at extracting student work from chat messages.
 Students may submit code, text, files, or other work embedded in their messages.
-Your job is to extract the actual submission content - all the code, solutions, or work they've submitted."""
-
-ASSIGNMENT_SUBMISSION_PARSER_PROMPT = PromptTemplate(
-    template="""Student's submission message:
-{message}
-
-Assignment details for context:
-{assignment_description}
+Your job is to extract the actual submission content - all the code, solutions, or work they've submitted.
 
-Extract the actual code, solution, or work the student has submitted. This might include:
+Submissions might include:
 - Code blocks (extract the code itself)
 - Multiple files (include all files with clear separation)
 - Written answers or explanations
 - Links or references to their work
 
 Combine everything they submitted into the submission_text field. Preserve code formatting and structure.
-If they submitted multiple files, clearly separate them with comments like '# File: filename.py'.""",
+If they submitted multiple files, clearly separate them with comments like '# File: filename.py'."""
+
+ASSIGNMENT_SUBMISSION_PARSER_PROMPT = FastPromptTemplate(
+    template="""Student's submission message:
+{message}
+
+Assignment details for context:
+{assignment_description}
+
+Extract the actual code, solution, or work the student has submitted.""",
     input_variables=["message", "assignment_description"]
 )
 
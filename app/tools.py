@@ -1,10 +1,87 @@
-from dotenv import load_dotenv
+import os
+from typing import Any, Hashable, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForToolRun
+from langchain_core.tools import ToolException
 from langchain_tavily import TavilySearch
 
-# Ensure environment variables are loaded
-load_dotenv()
+from app.cache import llm_cache, normalize_text
+
+
+# Search results are reused for a day; students on the same topic repeat the same lookups
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", str(24 * 60 * 60)))
+# Searches run at basic depth and are repeated at advanced depth only when no result
+# scores at least this well (advanced roughly doubles Tavily's response time)
+SEARCH_ESCALATION_SCORE = float(os.getenv("SEARCH_ESCALATION_SCORE", "0.6"))
+
+
+class _SearchFailed(Exception):
+    """Carries Tavily's error result out of the cache so it is not stored"""
+
+    def __init__(self, result: dict[str, Any]):
+        super().__init__(str(result.get("error")))
+        self.result = result
+
+
+def _search_key(tool: TavilySearch, query: str, **params: Any) -> Hashable:
+    return (
+        normalize_text(query),
+        tuple(sorted((name, tuple(value) if isinstance(value, list) else value) for name, value in params.items()))
+    )
+
+
+def _best_score(result: Optional[dict[str, Any]]) -> float:
+    """Highest relevance score in a search result; 0 for no result"""
+    if result is None:
+        return 0.0
+    return max((item.get("score", 0.0) for item in result.get("results", [])), default=0.0)
+
+
+@llm_cache(key=_search_key, ttl=SEARCH_CACHE_TTL)
+async def _cached_search(tool: TavilySearch, query: str, **params: Any) -> dict[str, Any]:
+    try:
+        result = await TavilySearch._arun(tool, query, **params)
+    except ToolException:
+        # Nothing found; worth one more try at advanced depth
+        if tool.search_depth != "basic":
+            raise
+        result = None
+
+    if tool.search_depth == "basic" and (result is None or "error" not in result):
+        if _best_score(result) < SEARCH_ESCALATION_SCORE:
+            advanced = tool.model_copy(update={"search_depth": "advanced"})
+            result = await TavilySearch._arun(advanced, query, **params)
+
+    if "error" in result:
+        raise _SearchFailed(result)
+    return result
+
+
+class CachedTavilySearch(TavilySearch):
+    """
+    Tavily search tool that reuses results for repeated queries
+
+    Queries are matched after lowercasing and collapsing whitespace, together with
+    any search parameters the agent passed. Concurrent identical searches share one
+    request. Failed searches and empty results are not cached.
+
+    A basic-depth search whose best result scores below SEARCH_ESCALATION_SCORE,
+    or that finds nothing, is retried once at advanced depth.
+    """
+
+    async def _arun(
+        self,
+        query: str,
+        run_manager: Optional[AsyncCallbackManagerForToolRun] = None,
+        **kwargs: Any
+    ) -> dict[str, Any]:
+        try:
+            return await _cached_search(self, query, **kwargs)
+        except _SearchFailed as e:
+            return e.result
+
 
-search = TavilySearch(
+search = CachedTavilySearch(
     max_results=5,
-    search_depth="advanced"
-)
\ No newline at end of file
+    search_depth="basic"
+)
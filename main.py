@@ -1,24 +1,76 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langserve import add_routes
-from app.graph import create_graph
+from app.checkpoint import sqlite_checkpointer
+from app.graph import CHECKPOINT_DURABILITY, create_graph, thread_config
 from app.models import MessageRequest
 from uuid import uuid4
+import logging
+import os
+
+# Node progress is logged at INFO; PROFESSOR_DEBUG=1 adds the app's parsing/grading traces
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+if os.getenv("PROFESSOR_DEBUG") == "1":
+    logging.getLogger("app").setLevel(logging.DEBUG)
+
+# Clients resume a session (e.g. to answer a quiz) by sending back its thread id
+THREAD_ID_HEADER = "X-Thread-Id"
 
 def add_thread_id(config: dict, request: Request) -> dict:
-    # Generate a unique thread_id for each request
-    config["configurable"] = {"thread_id": str(uuid4())}
+    # Continue the client's session when it names one, otherwise start a new thread
+    thread_id = request.headers.get(THREAD_ID_HEADER) or uuid4().hex
+    config.update(thread_config(thread_id))
     return config
 
-app = FastAPI()
+# Learning progress is kept in memory unless USE_PERSISTENCE=true
+USE_PERSISTENCE = os.getenv("USE_PERSISTENCE", "false").lower() == "true"
+DB_PATH = os.getenv("DB_PATH", "checkpoints/progress.db")
 
 graph = create_graph(checkpointer=None)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The SQLite checkpointer needs the server's event loop, so it replaces the
+    # in-memory one on startup rather than being passed to create_graph
+    if not USE_PERSISTENCE:
+        yield
+        return
+    async with sqlite_checkpointer(DB_PATH) as checkpointer:
+        graph.checkpointer = checkpointer
+        yield
+
+async def run_thread(request: dict, config: RunnableConfig):
+    """
+    Run the graph for one message, resuming the thread when it is paused for input
+
+    A paused thread (e.g. waiting for quiz answers) gets the message as the student's
+    reply and continues from where it stopped; new input would restart it at extraction.
+    Streams the graph state after each step, so the last chunk is the final state.
+    """
+    query = request["query"] if isinstance(request, dict) else request.query
+    graph_input = {"query": query}
+    if (await graph.aget_state(config)).next:
+        await graph.aupdate_state(config, {"messages": [HumanMessage(content=query)]})
+        graph_input = None
+    async for state in graph.astream(
+        graph_input, config, stream_mode="values", durability=CHECKPOINT_DURABILITY
+    ):
+        yield state
+
+app = FastAPI(lifespan=lifespan)
+
+# Every LangServe endpoint runs the graph with the configured checkpoint durability
 add_routes(
     app,
-    graph.with_types(input_type=MessageRequest), 
+    RunnableLambda(run_thread, name="professor").with_types(input_type=MessageRequest), 
     per_req_config_modifier=add_thread_id
 )
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    # The auto-reload file watcher and per-request access log are for development only;
+    # uvicorn picks uvloop and httptools on its own when they are installed
+    dev = os.getenv("DEV") == "1"
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=dev, access_log=dev)
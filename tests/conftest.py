@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+# The agents are built at import time and their clients need a key to construct;
+# no test reaches a provider
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+os.environ.setdefault("TAVILY_API_KEY", "test")
+
+from app import cache  # noqa: E402
+
+
+class FakeEmbeddings:
+    """Embeds text as letter counts, so texts with the same letters are identical vectors"""
+
+    def __init__(self):
+        self.requests: list[list[str]] = []
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.requests.append(texts)
+        return [[float(text.count(letter)) for letter in "abcdefghijklmnopqrstuvwxyz"] for text in texts]
+
+
+@pytest.fixture(autouse=True)
+def no_embeddings(monkeypatch):
+    """Skip semantic lookups unless a test installs fake embeddings"""
+    monkeypatch.setattr(cache, "_get_embeddings", lambda: None)
+
+
+@pytest.fixture
+def embeddings(monkeypatch) -> FakeEmbeddings:
+    fake = FakeEmbeddings()
+    monkeypatch.setattr(cache, "_get_embeddings", lambda: fake)
+    return fake
@@ -0,0 +1,209 @@
+import asyncio
+
+import pytest
+
+from app.cache import batch_llm_cache, llm_cache, normalize_text
+
+
+def test_llm_cache_exact_hit_uses_normalized_key():
+    calls = []
+
+    @llm_cache(key=lambda text: normalize_text(text))
+    async def echo(text: str) -> str:
+        calls.append(text)
+        return text.upper()
+
+    async def run():
+        return [await echo("Hello  World"), await echo("hello world")]
+
+    assert asyncio.run(run()) == ["HELLO  WORLD", "HELLO  WORLD"]
+    assert calls == ["Hello  World"]
+
+
+def test_llm_cache_evicts_least_recently_used():
+    calls = []
+
+    @llm_cache(key=lambda text: text, maxsize=2)
+    async def echo(text: str) -> str:
+        calls.append(text)
+        return text
+
+    async def run():
+        for text in ["a", "b", "a", "c", "a", "b"]:
+            await echo(text)
+
+    asyncio.run(run())
+    # "b" was least recently used when "c" arrived, so only it is computed again
+    assert calls == ["a", "b", "c", "b"]
+
+
+def test_llm_cache_shares_in_flight_call():
+    calls = []
+
+    @llm_cache(key=lambda text: text)
+    async def slow(text: str) -> str:
+        calls.append(text)
+        await asyncio.sleep(0.01)
+        return text
+
+    async def run():
+        return await asyncio.gather(slow("a"), slow("a"), slow("a"))
+
+    assert asyncio.run(run()) == ["a", "a", "a"]
+    assert calls == ["a"]
+
+
+def test_llm_cache_does_not_store_failures():
+    calls = []
+
+    @llm_cache(key=lambda text: text)
+    async def flaky(text: str) -> str:
+        calls.append(text)
+        if len(calls) == 1:
+            raise RuntimeError("provider error")
+        return text
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await flaky("a")
+        return await flaky("a")
+
+    assert asyncio.run(run()) == "a"
+    assert len(calls) == 2
+
+
+def test_llm_cache_semantic_hit_within_group(embeddings):
+    calls = []
+
+    @llm_cache(
+        key=lambda group, text: (group, text),
+        semantic=lambda group, text: (group, text),
+        threshold=0.99
+    )
+    async def grade(group: str, text: str) -> str:
+        calls.append((group, text))
+        return text
+
+    async def run():
+        return [
+            await grade("q1", "listen"),
+            await grade("q1", "silent"),  # same letters: a semantic hit
+            await grade("q2", "silent"),  # another group: a miss
+            await grade("q1", "unrelated")
+        ]
+
+    assert asyncio.run(run()) == ["listen", "listen", "silent", "unrelated"]
+    assert calls == [("q1", "listen"), ("q2", "silent"), ("q1", "unrelated")]
+
+
+def test_batch_llm_cache_only_computes_misses_in_one_call():
+    batches = []
+
+    @batch_llm_cache(key=lambda text: normalize_text(text))
+    async def upper(items: list[tuple[str]]) -> list[str]:
+        batches.append([text for text, in items])
+        return [text.upper() for text, in items]
+
+    async def run():
+        first = await upper([("a",), ("b",)])
+        second = await upper([("A",), ("c",), ("c",), ("d",)])
+        return first, second
+
+    assert asyncio.run(run()) == (["A", "B"], ["A", "C", "C", "D"])
+    assert batches == [["a", "b"], ["c", "d"]]
+
+
+def test_batch_llm_cache_respects_maxsize():
+    batches = []
+
+    @batch_llm_cache(key=lambda text: text, maxsize=2)
+    async def upper(items: list[tuple[str]]) -> list[str]:
+        batches.append([text for text, in items])
+        return [text.upper() for text, in items]
+
+    async def run():
+        # A batch larger than the cache still returns every result
+        first = await upper([("a",), ("b",), ("c",)])
+        second = await upper([("a",), ("b",), ("c",)])
+        return first, second
+
+    assert asyncio.run(run()) == (["A", "B", "C"], ["A", "B", "C"])
+    # Only the two most recent entries survived the first batch
+    assert batches == [["a", "b", "c"], ["a"]]
+
+
+def test_batch_llm_cache_awaits_items_in_flight():
+    batches = []
+
+    @batch_llm_cache(key=lambda text: text)
+    async def slow(items: list[tuple[str]]) -> list[str]:
+        batches.append([text for text, in items])
+        await asyncio.sleep(0.01)
+        return [text.upper() for text, in items]
+
+    async def run():
+        return await asyncio.gather(slow([("a",), ("b",)]), slow([("b",), ("c",)]))
+
+    assert asyncio.run(run()) == [["A", "B"], ["B", "C"]]
+    assert batches == [["a", "b"], ["c"]]
+
+
+def test_batch_llm_cache_rejects_wrong_result_count():
+    @batch_llm_cache(key=lambda text: text)
+    async def short(items: list[tuple[str]]) -> list[str]:
+        return ["x"]
+
+    with pytest.raises(ValueError):
+        asyncio.run(short([("a",), ("b",)]))
+
+
+def test_batch_llm_cache_semantic_hits_share_one_embedding_request(embeddings):
+    batches = []
+
+    @batch_llm_cache(
+        key=lambda group, text: (group, text),
+        semantic=lambda group, text: (group, text),
+        threshold=0.99
+    )
+    async def grade(items: list[tuple[str, str]]) -> list[str]:
+        batches.append(items)
+        return [text for _, text in items]
+
+    async def run():
+        await grade([("q1", "listen")])
+        return await grade([("q1", "silent"), ("q1", "other")])
+
+    assert asyncio.run(run()) == ["listen", "other"]
+    assert batches == [[("q1", "listen")], [("q1", "other")]]
+    assert embeddings.requests == [["listen"], ["silent", "other"]]
+
+
+def test_llm_cache_semantic_lookup_picks_the_closest_entry(embeddings):
+    @llm_cache(key=lambda text: text, semantic=lambda text: (None, text), threshold=0.7)
+    async def echo(text: str) -> str:
+        return text
+
+    async def run():
+        await echo("aaab")
+        await echo("abbb")  # 0.6 similar to "aaab": a miss
+        # About 0.79 similar to "aaab" (cached first) and 0.96 similar to "abbb"
+        return await echo("aabbb")
+
+    assert asyncio.run(run()) == "abbb"
+
+
+def test_llm_cache_semantic_group_is_capped(embeddings):
+    calls = []
+
+    @llm_cache(key=lambda text: text, semantic=lambda text: (None, text), threshold=0.99, semantic_maxsize=2)
+    async def echo(text: str) -> str:
+        calls.append(text)
+        return text
+
+    async def run():
+        for text in ["ab", "cd", "ef", "ba", "fe"]:
+            await echo(text)
+
+    asyncio.run(run())
+    # "ab" was dropped from the group when "ef" arrived; "ef" was still there for "fe"
+    assert calls == ["ab", "cd", "ef", "ba"]
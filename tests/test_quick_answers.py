@@ -0,0 +1,105 @@
+import pytest
+
+from app.graph import grade_multiple_choice, parse_quick_answers
+from app.models import MultipleChoiceQuestion, Quiz, ShortAnswerQuestion, TrueFalseQuestion
+
+
+def multiple_choice(correct_answer: str = "B") -> MultipleChoiceQuestion:
+    return MultipleChoiceQuestion(
+        question="Which is it?",
+        options=("Yes", "No", "Cannot tell", "Maybe"),
+        correct_answer=correct_answer,
+        explanation="Because"
+    )
+
+
+def true_false(correct_answer: bool = True) -> TrueFalseQuestion:
+    return TrueFalseQuestion(question="Is it?", correct_answer=correct_answer, explanation="Because")
+
+
+def short_answer() -> ShortAnswerQuestion:
+    return ShortAnswerQuestion(
+        question="What is a variable?",
+        correct_answer="A named place to store data",
+        key_points=("named", "stores data"),
+        explanation="Because"
+    )
+
+
+def quiz(*questions) -> Quiz:
+    return Quiz(lesson_title="Lesson", questions=list(questions))
+
+
+@pytest.mark.parametrize("message", [
+    "B, T, C, A, F",
+    "b t c a f",
+    "1. B 2. True 3) c 4: A 5 - false",
+    "1. B\n2. T\n3. C\n4. A\n5. F",
+])
+def test_parses_letter_and_true_false_lists(message):
+    answers = parse_quick_answers(
+        message, quiz(multiple_choice(), true_false(), multiple_choice(), multiple_choice(), true_false())
+    )
+    assert answers == {"q0": "B", "q1": "True", "q2": "C", "q3": "A", "q4": "False"}
+
+
+def test_keeps_text_after_a_letter_and_reasoning_after_true_false():
+    answers = parse_quick_answers(
+        "1. B) No\n2. False, because it isn't\n3. c\n4. a.\n5. t",
+        quiz(multiple_choice(), true_false(), multiple_choice(), multiple_choice(), true_false())
+    )
+    assert answers == {"q0": "B", "q1": "False", "q2": "C", "q3": "A", "q4": "True"}
+
+
+@pytest.mark.parametrize("message", [
+    "B, T, C",  # too few answers
+    "B, T, C, A, F, A",  # too many answers
+    "1. B\n2. maybe\n3. C\n4. A\n5. F",  # not a true/false answer
+    "1. Cannot tell\n2. T\n3. C\n4. A\n5. F",  # a word, not a letter
+    "I think B, then true, C, A and false",
+])
+def test_leaves_unclear_messages_to_the_parser_agent(message):
+    assert parse_quick_answers(
+        message, quiz(multiple_choice(), true_false(), multiple_choice(), multiple_choice(), true_false())
+    ) is None
+
+
+def test_short_answers_must_be_numbered():
+    questions = quiz(multiple_choice(), true_false(), short_answer(), multiple_choice(), true_false())
+    assert parse_quick_answers("B, T, C, A, F", questions) is None
+    assert parse_quick_answers(
+        "1. B\n2. T\n3. A place in memory, 2 names can't share it\n4. A\n5. F", questions
+    ) == {"q0": "B", "q1": "True", "q2": "A place in memory, 2 names can't share it", "q3": "A", "q4": "False"}
+
+
+@pytest.mark.parametrize("answer, expected", [
+    ("B", True),
+    ("b", True),
+    ("B) No", True),
+    ("b. no", True),
+    ("No", True),
+    ("  no ", True),
+    ("C", False),
+    ("Cannot tell", False),
+    ("Bogus", False),
+    ("", False),
+])
+def test_grade_multiple_choice(answer, expected):
+    assert grade_multiple_choice(multiple_choice("B"), answer) is expected
+
+
+def test_grade_multiple_choice_reads_an_option_text_answer_key():
+    question = multiple_choice("Cannot tell")
+    assert grade_multiple_choice(question, "C")
+    assert grade_multiple_choice(question, "cannot tell")
+    assert not grade_multiple_choice(question, "Cannot")
+
+
+def test_lines_of_a_multi_line_short_answer_are_not_answer_numbers():
+    questions = quiz(short_answer(), true_false(), multiple_choice(), multiple_choice(), true_false())
+    answers = parse_quick_answers(
+        "1. A variable has\n2 parts: a name\nand a value\n2. T\n3. C\n4. A\n5. F", questions
+    )
+    assert answers == {
+        "q0": "A variable has\n2 parts: a name\nand a value", "q1": "True", "q2": "C", "q3": "A", "q4": "False"
+    }
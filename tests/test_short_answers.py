@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from app import agents
+from app.cache import LLM_CACHE_SIZE
+from app.models import Confidence, ShortAnswerEvaluation
+
+
+def evaluation(student_answer: str) -> ShortAnswerEvaluation:
+    return ShortAnswerEvaluation(
+        is_correct=student_answer.startswith("right"),
+        reasoning=student_answer,
+        confidence=Confidence.HIGH
+    )
+
+
+@pytest.fixture
+def evaluator(monkeypatch):
+    """Replace the model calls with a fake evaluator that records each batch it is given"""
+    batches = []
+
+    async def evaluate(items):
+        batches.append([student_answer for _, _, student_answer in items])
+        await asyncio.sleep(0)
+        return [evaluation(student_answer) for _, _, student_answer in items]
+
+    monkeypatch.setattr(agents, "_evaluate_short_answers", evaluate)
+    monkeypatch.setattr(agents, "_short_answer_flush", None)
+    agents.evaluate_short_answers_batch.cache_clear()
+    yield batches
+    agents.evaluate_short_answers_batch.cache_clear()
+
+
+def item(student_answer: str, question: str = "What is a variable?"):
+    return (question, ["named", "stores data"], student_answer)
+
+
+def test_concurrent_submissions_share_one_call(evaluator):
+    async def run():
+        return await asyncio.gather(
+            agents.evaluate_short_answers_batch([item("right 1"), item("wrong 1")]),
+            agents.evaluate_short_answers_batch([item("right 2")])
+        )
+
+    first, second = asyncio.run(run())
+    assert [e.reasoning for e in first] == ["right 1", "wrong 1"]
+    assert [e.reasoning for e in second] == ["right 2"]
+    assert evaluator == [["right 1", "wrong 1", "right 2"]]
+
+
+def test_batches_are_capped_at_whole_submissions(evaluator, monkeypatch):
+    monkeypatch.setattr(agents, "SHORT_ANSWER_BATCH_MAX_ITEMS", 3)
+
+    async def run():
+        return await asyncio.gather(
+            agents.evaluate_short_answers_batch([item("a1"), item("a2")]),
+            agents.evaluate_short_answers_batch([item("b1"), item("b2")]),
+            agents.evaluate_short_answers_batch([item("c1")])
+        )
+
+    results = asyncio.run(run())
+    assert [[e.reasoning for e in result] for result in results] == [["a1", "a2"], ["b1", "b2"], ["c1"]]
+    assert sorted(evaluator) == [["a1", "a2"], ["b1", "b2", "c1"]]
+
+
+def test_failed_call_reaches_every_caller(monkeypatch):
+    async def fail(items):
+        raise RuntimeError("provider error")
+
+    monkeypatch.setattr(agents, "_evaluate_short_answers", fail)
+    monkeypatch.setattr(agents, "_short_answer_flush", None)
+    agents.evaluate_short_answers_batch.cache_clear()
+
+    async def run():
+        return await asyncio.gather(
+            agents.evaluate_short_answers_batch([item("x")]),
+            agents.evaluate_short_answers_batch([item("y")]),
+            return_exceptions=True
+        )
+
+    assert [type(result) for result in asyncio.run(run())] == [RuntimeError, RuntimeError]
+
+
+def test_verdicts_are_cached_per_answer(evaluator):
+    async def run():
+        await agents.evaluate_short_answers_batch([item("right answer"), item("wrong answer")])
+        # Same answers up to case and spacing, and one new answer
+        return await agents.evaluate_short_answers_batch([
+            item("Right  Answer"), item("new answer"), item("wrong answer", question="Another question?")
+        ])
+
+    results = asyncio.run(run())
+    assert [e.reasoning for e in results] == ["right answer", "new answer", "wrong answer"]
+    assert evaluator == [["right answer", "wrong answer"], ["new answer", "wrong answer"]]
+
+
+def test_short_answer_cache_is_capped(evaluator, monkeypatch):
+    monkeypatch.setattr(agents, "SHORT_ANSWER_COALESCE_SECONDS", 0)
+    answers = [f"answer {i}" for i in range(LLM_CACHE_SIZE + 1)]
+
+    async def run():
+        await agents.evaluate_short_answers_batch([item(answer) for answer in answers])
+        return await agents.evaluate_short_answers_batch([item(answer) for answer in answers[:2]])
+
+    results = asyncio.run(run())
+    assert [e.reasoning for e in results] == answers[:2]
+    # The oldest verdict was evicted to stay within the cap; the next one was kept
+    assert evaluator[1:] == [["answer 0"]]
+
+
+def test_similar_answers_do_not_share_a_verdict(evaluator, embeddings):
+    async def run():
+        await agents.evaluate_short_answers_batch([item("right: it increases")])
+        # Same letters, so the fake embeddings see an identical vector
+        return await agents.evaluate_short_answers_batch([item("right: it sacreeins")])
+
+    asyncio.run(run())
+    assert evaluator == [["right: it increases"], ["right: it sacreeins"]]
+    assert embeddings.requests == []
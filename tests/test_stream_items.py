@@ -0,0 +1,67 @@
+import asyncio
+from types import SimpleNamespace
+
+from pydantic import BaseModel
+
+from app import agents
+
+
+class Step(BaseModel):
+    name: str
+    minutes: int
+
+
+class Plan(BaseModel):
+    steps: list[Step]
+
+
+class FakeAgent:
+    """Streams the given tool-call argument chunks, then the final structured response"""
+
+    def __init__(self, calls: list[list[str]], response: Plan):
+        self.calls = calls
+        self.response = response
+
+    async def astream(self, *args, **kwargs):
+        for call in self.calls:
+            for i, args_chunk in enumerate(call):
+                tool_call_chunk = {"index": 0, "name": "Plan" if i == 0 else None, "args": args_chunk}
+                yield "messages", (SimpleNamespace(tool_call_chunks=[tool_call_chunk]), {})
+        yield "values", {"structured_response": self.response}
+
+
+def stream(agent: FakeAgent, monkeypatch) -> tuple[Plan, list[dict]]:
+    events = []
+    monkeypatch.setattr(agents, "get_stream_writer", lambda: events.append)
+    result = asyncio.run(agents._astream_items(agent, "prompt", Plan, "steps", "step"))
+    return result, events
+
+
+def test_items_are_validated_and_restart_with_a_retried_call(monkeypatch):
+    response = Plan(steps=[Step(name="b", minutes=1), Step(name="c", minutes=2)])
+    agent = FakeAgent(
+        [
+            ['{"steps": [{"name": "a", "minutes": "5"}, {'],
+            ['{"steps": [{"name": "b", "minutes": 1}, {', '"name": "c", "minutes": 2}]}'],
+        ],
+        response
+    )
+
+    result, events = stream(agent, monkeypatch)
+    assert result == response
+    assert events == [
+        {"type": "step", "index": 0, "item": {"name": "a", "minutes": 5}},
+        {"type": "step", "index": 0, "item": {"name": "b", "minutes": 1}},
+        {"type": "step", "index": 1, "item": {"name": "c", "minutes": 2}},
+    ]
+
+
+def test_invalid_items_are_left_for_the_final_response(monkeypatch):
+    response = Plan(steps=[Step(name="a", minutes=3), Step(name="b", minutes=4)])
+    agent = FakeAgent([['{"steps": [{"name": "a"}, {', '"name": "b", "minutes": 4}]}']], response)
+
+    _, events = stream(agent, monkeypatch)
+    assert events == [
+        {"type": "step", "index": 0, "item": {"name": "a", "minutes": 3}},
+        {"type": "step", "index": 1, "item": {"name": "b", "minutes": 4}},
+    ]